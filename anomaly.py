@@ -0,0 +1,241 @@
+import math
+import os
+import sys
+from datetime import datetime
+from file_utils import load_json, save_json, file_lock
+
+STATE_DIR = "anomaly_state"               # one <user>.json per user
+LEGACY_STATE_FILE = "anomaly_state.json"  # single-file state from older versions
+MIN_HISTORY = 3          # readings needed before jump detection kicks in
+JUMP_Z = 3.0             # standard deviations from the user's own mean
+JUMP_RATIO = 0.5         # fallback when every earlier reading was identical
+MAX_FLAGS_PER_USER = 200
+
+# Typical adult reference intervals in the units our lab reports use; None = no bound
+REFERENCE_RANGES = {
+    "Hemoglobin": (12.0, 17.0),
+    "Total Leucocytes": (4.0, 11.0),
+    "WBC": (4.0, 11.0),
+    "Platelet count": (150.0, 450.0),
+    "RBC": (4.0, 6.0),
+    "PCV": (36.0, 50.0),
+    "MCV": (80.0, 100.0),
+    "MCH": (27.0, 33.0),
+    "MCHC": (32.0, 36.0),
+    "RDW": (11.5, 14.5),
+    "MPV": (7.5, 11.5),
+    "Neutrophils": (40.0, 75.0),
+    "Eosinophils": (1.0, 6.0),
+    "Basophils": (0.0, 2.0),
+    "Lymphocytes": (20.0, 45.0),
+    "Monocytes": (2.0, 10.0),
+    "Bilirubin": (0.2, 1.2),
+    "Bilirubin-Total": (0.2, 1.2),
+    "Bilirubin-Conjugated": (0.0, 0.3),
+    "Bilirubin-Unconjugated": (0.1, 1.0),
+    "SGOT": (0.0, 40.0),
+    "AST": (0.0, 40.0),
+    "SGPT": (0.0, 41.0),
+    "ALT": (0.0, 41.0),
+    "Alkaline Phosphatase": (40.0, 129.0),
+    "Protein": (6.4, 8.3),
+    "Albumin": (3.5, 5.2),
+    "Globulin": (2.0, 3.5),
+    "GGT": (0.0, 60.0),
+    "Gamma Glutamyl Transferase": (0.0, 60.0),
+    "Glucose": (70.0, 140.0),
+    "Fasting Glucose": (70.0, 100.0),
+    "Post Prandial Glucose": (70.0, 140.0),
+    "Creatinine": (0.6, 1.3),
+    "Sodium": (135.0, 145.0),
+    "Potassium": (3.5, 5.1),
+    "Chloride": (98.0, 107.0),
+    "INR": (0.8, 1.2),
+    "Total Cholesterol": (None, 200.0),
+    "Triglycerides": (None, 150.0),
+    "HDL": (40.0, None),
+    "LDL": (None, 100.0),
+    "VLDL": (None, 30.0),
+    "HbA1C": (4.0, 5.7),
+}
+
+
+def check_range(param, value):
+    low, high = REFERENCE_RANGES.get(param, (None, None))
+    if low is not None and value < low:
+        return "low", f"below {low:g}"
+    if high is not None and value > high:
+        return "high", f"above {high:g}"
+    return None
+
+
+def check_jump(stats, value):
+    if not stats:
+        return None
+    n, mean, m2, _ = stats
+    if n < MIN_HISTORY:
+        return None
+    std = math.sqrt(m2 / (n - 1))
+    if std > 0:
+        z = (value - mean) / std
+        if abs(z) > JUMP_Z:
+            return "jump", f"{z:+.1f}σ from usual {mean:.2f}"
+    elif mean and abs(value - mean) / abs(mean) > JUMP_RATIO:
+        return "jump", f"changed from steady {mean:.2f}"
+    return None
+
+
+def welford(stats, value):
+    n, mean, m2, _ = stats or (0, 0.0, 0.0, None)
+    n += 1
+    delta = value - mean
+    mean += delta / n
+    m2 += delta * (value - mean)
+    return [n, mean, m2, value]
+
+
+def _observe(state, results, timestamp, filename):
+    user_stats = state["stats"]
+    raised = []
+    for param, value in results.items():
+        if not isinstance(value, (int, float)):
+            continue
+        for finding in (check_range(param, value), check_jump(user_stats.get(param), value)):
+            if finding:
+                kind, detail = finding
+                raised.append({
+                    "timestamp": timestamp,
+                    "filename": filename,
+                    "parameter": param,
+                    "value": value,
+                    "kind": kind,
+                    "detail": detail
+                })
+        user_stats[param] = welford(user_stats.get(param), value)
+    if raised:
+        state["flags"].extend(raised)
+        del state["flags"][:-MAX_FLAGS_PER_USER]
+    return raised
+
+
+class AnomalyEngine:
+    """
+    Keeps per-user, per-parameter running mean/variance so each new report is checked in O(1),
+    and remembers the flags it raised so views never have to rescan history.
+    Each user's state is its own file, re-read and rewritten under that file's lock, so
+    dashboards, the service and the watcher can update it side by side without losing anything.
+    """
+
+    def __init__(self, state_dir=STATE_DIR):
+        self.state_dir = state_dir
+        self._working = {}   # user -> state with the not yet saved observations applied
+        self._pending = {}   # user -> [(results, timestamp, filename)] not yet saved
+        self._migrate_legacy()
+
+    def _path(self, user):
+        if not user or os.sep in user or (os.altsep and os.altsep in user) or user.startswith("."):
+            raise ValueError(f"Invalid user name for anomaly state: {user!r}")
+        return os.path.join(self.state_dir, f"{user}.json")
+
+    def _load(self, user):
+        return load_json(self._path(user), {"stats": {}, "flags": []})
+
+    def _migrate_legacy(self):
+        if os.path.isdir(self.state_dir) or not os.path.exists(LEGACY_STATE_FILE):
+            return
+        legacy = load_json(LEGACY_STATE_FILE, {})
+        stats, flags = legacy.get("stats", {}), legacy.get("flags", {})
+        for user in set(stats) | set(flags):
+            save_json(self._path(user), {"stats": stats.get(user, {}), "flags": flags.get(user, [])}, indent=None)
+        os.makedirs(self.state_dir, exist_ok=True)
+
+    def update(self, user, results, timestamp=None, filename=None, save=True):
+        """
+        Checks a report against the user's history and records it. With save=False the
+        observation is kept until save(), for bulk imports that write once per batch.
+        """
+        timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if save and user not in self._pending:
+            with file_lock(self._path(user)):
+                state = self._load(user)
+                raised = _observe(state, results, timestamp, filename)
+                save_json(self._path(user), state, indent=None)
+            return raised
+        if user not in self._working:
+            self._working[user] = self._load(user)
+        self._pending.setdefault(user, []).append((results, timestamp, filename))
+        raised = _observe(self._working[user], results, timestamp, filename)
+        if save:
+            self.save()
+        return raised
+
+    def save(self):
+        """
+        Replays the pending observations onto each user's current file, so updates
+        other processes made in the meantime are kept.
+        """
+        for user, observations in self._pending.items():
+            with file_lock(self._path(user)):
+                state = self._load(user)
+                for results, timestamp, filename in observations:
+                    _observe(state, results, timestamp, filename)
+                save_json(self._path(user), state, indent=None)
+        self._working, self._pending = {}, {}
+
+    def users(self):
+        if not os.path.isdir(self.state_dir):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.state_dir) if name.endswith(".json"))
+
+    def flags_for(self, user, limit=None):
+        user_flags = self._load(user)["flags"]
+        return user_flags[-limit:] if limit else user_flags
+
+    def backfill(self, store):
+        """
+        Rebuilds all statistics and flags from a MeasurementStore in one pass over its columns.
+        """
+        self._working, self._pending = {}, {}
+        for user in set(self.users()) - set(store.users):
+            with file_lock(self._path(user)):
+                os.remove(self._path(user))
+        for user in store.users:
+            state = {"stats": {}, "flags": []}
+            for row in store.user_rows(user):
+                timestamp = store.timestamp(row).strftime("%Y-%m-%d %H:%M:%S")
+                _observe(state, store.results(row), timestamp, None)
+            with file_lock(self._path(user)):
+                save_json(self._path(user), state, indent=None)
+
+
+def format_alert(user, flags):
+    lines = [f"⚠️ {user}: {len(flags)} value(s) need attention\n"]
+    for flag in flags:
+        lines.append(f"• {flag['parameter']}: {flag['value']} ({flag['kind']}, {flag['detail']})")
+    return "\n".join(lines)
+
+
+_engine = None
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        _engine = AnomalyEngine()
+    return _engine
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["backfill"]:
+        from measurement_store import rebuild_all
+        engine = get_engine()
+        with rebuild_all() as measurement_store:
+            engine.backfill(measurement_store)
+        users = engine.users()
+        print(f"✅ Backfilled {sum(len(engine.flags_for(u)) for u in users)} flags for {len(users)} users.")
+    else:
+        engine = get_engine()
+        for username in engine.users():
+            user_flags = engine.flags_for(username, 10)
+            if user_flags:
+                print(format_alert(username, user_flags) + "\n")
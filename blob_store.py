@@ -0,0 +1,348 @@
+import hashlib
+import os
+import sys
+import tempfile
+import time
+import zipfile
+import zlib
+from datetime import datetime
+from file_utils import load_json, save_json, file_lock
+
+USER_REPORTS_DIR = "user_reports"
+BLOB_DIR = "report_blobs"
+REFS_FILE = "refs.json"
+ARCHIVE_FILE = "archive.zip"
+ARCHIVE_AFTER_DAYS = 180
+RESTORE_DIR = os.path.join(tempfile.gettempdir(), "health_analyzer_restored")
+RESTORE_TTL_SECONDS = 24 * 3600    # restored copies are only for viewing
+CHUNK_SIZE = 1024 * 1024
+# a blob is written before its reference is saved; gc leaves blobs touched this recently alone
+GC_GRACE_SECONDS = 3600
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def blob_path(digest):
+    return os.path.join(BLOB_DIR, digest[:2], f"{digest}.pdf")
+
+
+def put_bytes(digest, data):
+    """
+    Stores an already hashed buffer. Returns the number of bytes written (0 if the blob existed).
+    An existing blob is touched, so a gc running before its new reference is saved keeps it.
+    """
+    dest = blob_path(digest)
+    with file_lock(BLOB_DIR):
+        if os.path.exists(dest):
+            os.utime(dest)
+            return 0
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp_path = f"{dest}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, dest)
+    return len(data)
+
+
+def _refs_path(user):
+    return os.path.join(USER_REPORTS_DIR, user, REFS_FILE)
+
+
+def load_refs(user):
+    return load_json(_refs_path(user), {})
+
+
+def add_reference(user, filename, digest):
+    """
+    Records filename -> digest for the user and returns the name it was stored under.
+    A different report already stored under that name keeps it; the new one gets a digest suffix.
+    """
+    refs = load_refs(user)
+    if refs.get(filename, digest) != digest:
+        stem, ext = os.path.splitext(filename)
+        filename = f"{stem}_{digest[:8]}{ext}"
+    refs[filename] = digest
+    save_json(_refs_path(user), refs)
+    return filename
+
+
+def _archive_path(user):
+    return os.path.join(USER_REPORTS_DIR, user, ARCHIVE_FILE)
+
+
+def archived_digests(user):
+    path = _archive_path(user)
+    if not os.path.exists(path):
+        return set()
+    # only the central directory at the end of the file is read
+    with zipfile.ZipFile(path) as archive:
+        return {os.path.splitext(name)[0] for name in archive.namelist()}
+
+
+def read_archived(user, digest):
+    """
+    Returns one archived report's bytes, decompressing only that member, or None.
+    """
+    path = _archive_path(user)
+    if not os.path.exists(path):
+        return None
+    with zipfile.ZipFile(path) as archive:
+        try:
+            return archive.read(f"{digest}.pdf")
+        except KeyError:
+            return None
+
+
+def _prune_restored():
+    if not os.path.isdir(RESTORE_DIR):
+        return
+    cutoff = time.time() - RESTORE_TTL_SECONDS
+    for name in os.listdir(RESTORE_DIR):
+        path = os.path.join(RESTORE_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            continue  # already gone, or still open in a viewer on Windows
+
+
+def resolve(user, filename):
+    """
+    Returns the on-disk path of a user's report, or None if it is not stored.
+    Archived reports are restored from that user's archive to a temporary file, which is
+    deleted RESTORE_TTL_SECONDS after it was last asked for.
+    """
+    digest = load_refs(user).get(filename)
+    if digest:
+        path = blob_path(digest)
+        if os.path.exists(path):
+            return path
+        restored = os.path.join(RESTORE_DIR, f"{digest}.pdf")
+        if os.path.exists(restored):
+            os.utime(restored)
+            return restored
+        data = read_archived(user, digest)
+        if data is None:
+            legacy = os.path.join(USER_REPORTS_DIR, user, filename)
+            # referenced but not moved yet (an interrupted migrate)
+            return legacy if os.path.exists(legacy) else None
+        _prune_restored()
+        os.makedirs(RESTORE_DIR, exist_ok=True)
+        tmp_path = f"{restored}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, restored)
+        return restored
+    legacy = os.path.join(USER_REPORTS_DIR, user, filename)
+    return legacy if os.path.exists(legacy) else None
+
+
+def _user_dirs():
+    if not os.path.isdir(USER_REPORTS_DIR):
+        return []
+    return sorted(name for name in os.listdir(USER_REPORTS_DIR)
+                  if os.path.isdir(os.path.join(USER_REPORTS_DIR, name)))
+
+
+def referenced_digests():
+    """
+    Every digest a refs.json or a history entry still points at.
+    """
+    import report_store
+    digests = set()
+    for user in _user_dirs():
+        digests.update(load_refs(user).values())
+    for user in report_store.users():
+        digests.update(r["sha256"] for r in report_store.iter_user_reports(user) if r.get("sha256"))
+    return digests
+
+
+def collect_garbage(dry_run=False):
+    """
+    Deletes blobs that no user references any more. Returns (blobs removed, bytes freed).
+    Runs under the same lock as put_bytes and skips blobs written or reused within
+    GC_GRACE_SECONDS, whose reference may not have been saved yet.
+    """
+    removed, freed = 0, 0
+    if not os.path.isdir(BLOB_DIR):
+        return removed, freed
+    with file_lock(BLOB_DIR):
+        live = referenced_digests()
+        cutoff = time.time() - GC_GRACE_SECONDS
+        for folder, _, files in os.walk(BLOB_DIR):
+            for name in files:
+                digest, ext = os.path.splitext(name)
+                path = os.path.join(folder, name)
+                if ext != ".pdf" or digest in live or os.path.getmtime(path) > cutoff:
+                    continue
+                freed += os.path.getsize(path)
+                removed += 1
+                if not dry_run:
+                    os.remove(path)
+    return removed, freed
+
+
+def migrate():
+    """
+    Moves the PDFs already sitting in user_reports/<user>/ into the blob store,
+    collapsing byte-identical copies. Returns (files migrated, bytes freed).
+    """
+    migrated, freed = 0, 0
+    for user in _user_dirs():
+        folder = os.path.join(USER_REPORTS_DIR, user)
+        refs = load_refs(user)
+        for name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, name)
+            if not name.lower().endswith(".pdf") or not os.path.isfile(path):
+                continue
+            digest = hash_file(path)
+            dest = blob_path(digest)
+            # reference first: a crash below leaves a loose file that is both referenced and
+            # still on disk, never a blob nobody references
+            refs[name] = digest
+            save_json(_refs_path(user), refs)
+            if os.path.exists(dest):
+                freed += os.path.getsize(path)
+                os.remove(path)
+            else:
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                os.replace(path, dest)
+            migrated += 1
+    return migrated, freed
+
+
+def _report_times(user):
+    import report_store
+    times = {}
+    for report in report_store.iter_user_reports(user):
+        try:
+            times[report["filename"]] = datetime.strptime(report["timestamp"], "%Y-%m-%d %H:%M:%S").timestamp()
+        except (KeyError, ValueError):
+            continue
+    return times
+
+
+def _worth_deflating(source):
+    with open(source, "rb") as f:
+        sample = f.read(CHUNK_SIZE)
+    return len(zlib.compress(sample, 9)) < len(sample) * 0.98
+
+
+def _add_members(user, members):
+    """
+    Appends the new (digest, source path) members to the user's archive in place.
+    Members are streamed from disk one at a time, and deflated only if their first chunk shrinks.
+    """
+    path = _archive_path(user)
+    # mtimes before 1980 (restored backups) are clamped instead of rejected
+    with file_lock(path), zipfile.ZipFile(path, "a", strict_timestamps=False) as archive:
+        for digest, source in members:
+            compress_type = zipfile.ZIP_DEFLATED if _worth_deflating(source) else zipfile.ZIP_STORED
+            archive.write(source, f"{digest}.pdf", compress_type=compress_type, compresslevel=9)
+
+
+def archive_old_reports(max_age_days=ARCHIVE_AFTER_DAYS, dry_run=False):
+    """
+    Moves reports older than max_age_days into user_reports/<user>/archive.zip.
+    A shared blob is deleted only once every user referencing it has archived it.
+    Returns (reports archived, bytes freed).
+    """
+    cutoff = time.time() - max_age_days * 24 * 3600
+    archived, freed = 0, 0
+    removable = {}
+    for user in _user_dirs():
+        folder = os.path.join(USER_REPORTS_DIR, user)
+        refs = load_refs(user)
+        already = archived_digests(user)
+        times = _report_times(user)
+        candidates = [(filename, blob_path(digest), digest) for filename, digest in refs.items()]
+        # PDFs from before the blob store was introduced still sit loose in the user's folder
+        candidates += [(name, os.path.join(folder, name), None) for name in sorted(os.listdir(folder))
+                       if name.lower().endswith(".pdf") and name not in refs
+                       and os.path.isfile(os.path.join(folder, name))]
+
+        members, legacy_files = {}, []
+        for filename, source, digest in candidates:
+            if not os.path.exists(source) or times.get(filename, os.path.getmtime(source)) >= cutoff:
+                continue
+            if digest is None:
+                digest = hash_file(source)
+                refs[filename] = digest
+                legacy_files.append(source)
+            if digest not in already and digest not in members:
+                members[digest] = source
+                archived += 1
+
+        if not dry_run and members:
+            _add_members(user, members.items())
+        if not dry_run and legacy_files:
+            save_json(_refs_path(user), refs)
+        for path in legacy_files:
+            freed += os.path.getsize(path)
+            if not dry_run:
+                os.remove(path)
+        removable[user] = already | set(members)
+
+    # a blob can go once nobody still needs the loose copy; refs are read under the blob lock and
+    # recently touched blobs are kept, so an upload of the same bytes meanwhile never loses its file
+    with file_lock(BLOB_DIR):
+        cutoff = time.time() - GC_GRACE_SECONDS
+        needed = {}
+        for user in _user_dirs():
+            for digest in load_refs(user).values():
+                needed.setdefault(digest, []).append(digest in removable.get(user, ()))
+        for digest, archived_by in needed.items():
+            path = blob_path(digest)
+            if all(archived_by) and os.path.exists(path) and os.path.getmtime(path) <= cutoff:
+                freed += os.path.getsize(path)
+                if not dry_run:
+                    os.remove(path)
+                    if not os.listdir(os.path.dirname(path)):
+                        os.rmdir(os.path.dirname(path))
+    return archived, freed
+
+
+def disk_usage():
+    total, count = 0, 0
+    for folder, _, files in os.walk(BLOB_DIR):
+        for name in files:
+            total += os.path.getsize(os.path.join(folder, name))
+            count += 1
+    return count, total
+
+
+def archive_usage():
+    total, count = 0, 0
+    for user in _user_dirs():
+        path = _archive_path(user)
+        if os.path.exists(path):
+            total += os.path.getsize(path)
+            count += len(archived_digests(user))
+    return count, total
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "migrate":
+        files, saved = migrate()
+        print(f"✅ Migrated {files} reports, {saved / 1e6:.1f} MB of duplicates collapsed.")
+    elif command == "gc":
+        blobs, saved = collect_garbage(dry_run="--dry-run" in sys.argv)
+        print(f"🧹 Removed {blobs} unreferenced blobs ({saved / 1e6:.1f} MB).")
+    elif command == "archive":
+        days = int(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[2].isdigit() else ARCHIVE_AFTER_DAYS
+        reports, saved = archive_old_reports(days, dry_run="--dry-run" in sys.argv)
+        print(f"🗄️ Archived {reports} reports older than {days} days, {saved / 1e6:.1f} MB of loose files freed.")
+    elif command == "stats":
+        blobs, size = disk_usage()
+        archived, archive_size = archive_usage()
+        print(f"📦 {blobs} unique reports stored, {size / 1e6:.1f} MB; "
+              f"{archived} archived, {archive_size / 1e6:.1f} MB.")
+    else:
+        print("Usage: python blob_store.py [migrate | gc [--dry-run] | archive [days] [--dry-run] | stats]")
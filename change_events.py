@@ -0,0 +1,217 @@
+import json
+import os
+import time
+from file_utils import file_lock
+
+EVENTS_DIR = "change_events"
+POLL_INTERVAL_MS = 1000
+MAX_LOG_BYTES = 1024 * 1024    # a topic's log is rotated to <topic>.log.1 past this size
+
+_subscribers = {}
+
+
+def _log_path(topic):
+    return os.path.join(EVENTS_DIR, f"{topic}.log")
+
+
+def _rotated_path(topic):
+    return _log_path(topic) + ".1"
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+        return st.st_ino, st.st_size
+    except FileNotFoundError:
+        return None, 0
+
+
+def _header(f):
+    """
+    The generation number a log file starts with, leaving f just past the header.
+    Each new log file is one generation after the one it replaced; logs without a header count as 0.
+    """
+    f.seek(0)
+    try:
+        generation = json.loads(f.readline()).get("generation")
+    except ValueError:
+        generation = None
+    if generation is None:
+        f.seek(0)
+        return 0
+    return generation
+
+
+def _generation(path):
+    try:
+        with open(path, "rb") as f:
+            return _header(f)
+    except FileNotFoundError:
+        return None
+
+
+def subscribe(topic, callback):
+    """
+    Calls callback(event) for every event this process publishes on topic. Returns an unsubscribe function.
+    """
+    callbacks = _subscribers.setdefault(topic, [])
+    callbacks.append(callback)
+
+    def unsubscribe():
+        if callback in callbacks:
+            callbacks.remove(callback)
+    return unsubscribe
+
+
+def publish_many(topic, events):
+    """
+    Appends the events to the topic's log in one write (other processes pick them up from there)
+    and hands them to this process's subscribers straight away. Events should name what changed
+    rather than carry it, so the log stays small; readers load the data themselves.
+    """
+    if not events:
+        return
+    stamped = [dict(event, pid=os.getpid(), at=time.time()) for event in events]
+    data = "".join(json.dumps(event) + "\n" for event in stamped).encode("utf-8")
+    path = _log_path(topic)
+    with file_lock(path):
+        size = version(topic)
+        if size and size + len(data) > MAX_LOG_BYTES:
+            # one older generation is kept so cursors can finish reading it
+            os.replace(path, _rotated_path(topic))
+            size = 0
+        if not size:
+            generation = (_generation(_rotated_path(topic)) or 0) + 1
+            data = (json.dumps({"generation": generation}) + "\n").encode("utf-8") + data
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+    for event in stamped:
+        for callback in list(_subscribers.get(topic, [])):
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"⚠️ {topic} subscriber failed: {e}")
+
+
+def publish(topic, event):
+    publish_many(topic, [event])
+
+
+def version(topic):
+    """
+    The size of the current log; it grows with every publish and starts over on rotation.
+    """
+    return _stat(_log_path(topic))[1]
+
+
+class EventCursor:
+    """
+    Reads a topic's log from where it last stopped, so each poll costs a stat plus the new bytes.
+    The log file is identified by its generation header (inode numbers are reused once the
+    old file is deleted); after a rotation the rest of the previous generation is read first.
+    If the cursor fell more than one rotation behind, the events in between are gone and poll
+    returns a {"action": "resync"} event instead, telling the reader to reload what it shows.
+    """
+
+    def __init__(self, topic, from_start=False):
+        self.topic = topic
+        self.inode, self.generation, self.offset = None, 0, 0
+        for path in (_log_path(topic), _rotated_path(topic)):
+            try:
+                f = open(path, "rb")
+            except FileNotFoundError:
+                continue
+            with f:
+                self.generation = _header(f)
+                st = os.fstat(f.fileno())
+                self.inode = st.st_ino
+                self.offset = 0 if from_start else st.st_size
+            break
+
+    def poll(self):
+        inode, size = _stat(_log_path(self.topic))
+        if inode == self.inode and size == self.offset:
+            return []
+        try:
+            f = open(_log_path(self.topic), "rb")
+        except FileNotFoundError:
+            return []
+        with f:
+            generation = _header(f)
+            events = []
+            if generation != self.generation:
+                if generation == self.generation + 1:
+                    events += self._read_rotated()
+                else:
+                    events.append(self._resync())
+                self.generation, self.offset = generation, 0
+            self.inode = os.fstat(f.fileno()).st_ino
+            return events + self._read(f)
+
+    def _read_rotated(self):
+        try:
+            f = open(_rotated_path(self.topic), "rb")
+        except FileNotFoundError:
+            # nothing to finish if the cursor started before the first log existed
+            return [] if self.inode is None else [self._resync()]
+        with f:
+            if _header(f) != self.generation:
+                return [self._resync()]  # rotated again since the stat
+            return self._read(f)
+
+    def _resync(self):
+        return {"action": "resync", "topic": self.topic, "at": time.time()}
+
+    def _read(self, f):
+        """
+        Returns the complete events in f after the offset; f is positioned just past its header.
+        """
+        size = os.fstat(f.fileno()).st_size
+        if size < self.offset:
+            self.offset = 0  # the log was cleared while we were running
+        start = max(self.offset, f.tell())
+        f.seek(start)
+        data = f.read(size - start)
+        self.offset = start
+        # a line still being written is left for the next poll
+        complete = data[:data.rfind(b"\n") + 1]
+        self.offset += len(complete)
+        events = []
+        for line in complete.splitlines():
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+        return events
+
+
+def watch(widget, topic, callback, interval=POLL_INTERVAL_MS):
+    """
+    Delivers every new event on topic to callback on the Tk thread until widget is destroyed:
+    this process's events immediately, other processes' events on the next poll.
+    Callbacks must handle {"action": "resync"} by reloading their data from the stores.
+    """
+    cursor = EventCursor(topic)
+    unsubscribe = subscribe(topic, callback)
+    state = {"job": None}
+
+    def tick():
+        for event in cursor.poll():
+            if event.get("pid") != os.getpid():
+                callback(event)
+        state["job"] = widget.after(interval, tick)
+
+    def stop(event=None):
+        if event is not None and event.widget is not widget:
+            return
+        unsubscribe()
+        if state["job"]:
+            widget.after_cancel(state["job"])
+            state["job"] = None
+
+    widget.bind("<Destroy>", stop, add="+")
+    state["job"] = widget.after(interval, tick)
+    return stop
@@ -1,49 +1,38 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 from tkcalendar import DateEntry
-import pdfplumber
 import os
+import sys
 import json
-import csv
-import re
-from datetime import datetime
-from telegram_notifier import send_telegram_message
-
-REPORT_HISTORY_FILE = "report_history.json"
-USERS_FILE = "users.csv"
+import subprocess
+from telegram_notifier import notify_in_background
+import report_store
+import change_events
+import blob_store
+from ingest import ingest_report
+from user_directory import get_directory, SEARCH_LIMIT
+from anomaly import format_alert
+from population import PopulationStats, ALL, BANDS
+from structured_import import import_file
+import service_client
 
 # 🎨 Visual Constants
 PRIMARY_COLOR = "#32de84"
 LIGHT_BG = "#f1fdf6"
 TEXT_COLOR = "#222"
-
-# ✅ Extract date from report text
-def extract_date_from_text(text):
-    date_patterns = [
-        r"\b\d{2}[-/]\d{2}[-/]\d{4}\b",
-        r"\b\d{4}[-/]\d{2}[-/]\d{2}\b",
-    ]
-    for pattern in date_patterns:
-        match = re.search(pattern, text)
-        if match:
-            return match.group(0)
-    return "Unknown"
+HISTORY_INSERT_CHUNK = 500    # history rows inserted per Tk callback during large imports
 
 class PDFAnalyzer:
     def __init__(self):
         self.keywords = self.load_keywords()
         self.report_history = self.load_report_history()
         self.users = self._load_users_from_csv()
+        self.last_flags = []
 
     def _load_users_from_csv(self):
         users_list = []
         try:
-            if os.path.exists(USERS_FILE):
-                with open(USERS_FILE, "r", newline='') as file:
-                    reader = csv.DictReader(file)
-                    for row in reader:
-                        if "username" in row:
-                            users_list.append(row["username"])
+            users_list = get_directory().names()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load users: {str(e)}")
         return users_list
@@ -56,51 +45,40 @@ class PDFAnalyzer:
         with open("keywords.txt", "r") as f:
             return [line.strip() for line in f if line.strip()]
 
+    def latest_values(self, user):
+        reports = service_client.reports(user) if service_client.enabled() else report_store.load_user_reports(user)
+        latest = {}
+        for report in sorted(reports, key=lambda r: r["timestamp"]):
+            latest.update({k: v for k, v in report.get("results", {}).items() if isinstance(v, (int, float))})
+        return latest
+
     def load_report_history(self):
-        if os.path.exists(REPORT_HISTORY_FILE):
-            with open(REPORT_HISTORY_FILE, "r") as f:
-                try:
-                    content = f.read()
-                    return json.loads(content) if content else []
-                except Exception:
-                    return []
-        return []
-
-    def save_report_history(self):
-        with open(REPORT_HISTORY_FILE, "w") as f:
-            json.dump(self.report_history, f, indent=4)
+        if service_client.enabled():
+            return service_client.reports()
+        try:
+            return report_store.load_all_reports()
+        except Exception:
+            return []
+
+    def save_report(self, report_entry):
+        # the "added" event this publishes is what puts the entry into report_history
+        report_store.append_report(report_entry)
 
     def extract_values(self, pdf_path, assigned_to_user):
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                text = ' '.join(page.extract_text() or "" for page in pdf.pages)
+            if service_client.enabled():
+                report_entry = service_client.ingest(pdf_path, assigned_to_user)
+                self.last_flags = report_entry["flags"]
+                return report_entry["results"]
+
+            report_entry, text = ingest_report(pdf_path, assigned_to_user, self.keywords)
+            self.last_flags = report_entry["flags"]
             if not text:
                 messagebox.showwarning("PDF Content", "No readable text found.")
                 return {}
 
-            report_date = extract_date_from_text(text)
-            results = {}
-            normalized_text = re.sub(r'\s+', ' ', text).lower()
-            for keyword in self.keywords:
-                pattern = rf"{re.escape(keyword.lower())}\s*.*?(\d+(?:[.,]\d+)*)"
-                match = re.search(pattern, normalized_text)
-                if match:
-                    try:
-                        value = float(match.group(1).replace(',', '.'))
-                        results[keyword] = value
-                    except ValueError:
-                        continue
-
-            report_entry = {
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "filename": os.path.basename(pdf_path),
-                "assigned_to": assigned_to_user,
-                "report_date": report_date,
-                "results": results
-            }
-            self.report_history.append(report_entry)
-            self.save_report_history()
-            return results
+            self.save_report(report_entry)
+            return report_entry["results"]
         except Exception as e:
             messagebox.showerror("Error", f"Error processing PDF: {str(e)}")
             return {}
@@ -113,14 +91,42 @@ def show_dashboard(username):
         if not selected_user:
             messagebox.showwarning("User Selection", "Please select a user.")
             return
+        if selected_user not in get_directory():
+            messagebox.showwarning("User Selection", f"Unknown user: {selected_user}")
+            return
         file_path = filedialog.askopenfilename(title="Select Health Report", filetypes=[("PDF Files", "*.pdf")])
         if file_path:
             results = analyzer.extract_values(file_path, selected_user)
-            display_results(results)
-            update_history()
+            display_results(results, analyzer.last_flags)
+            if analyzer.last_flags:
+                notify_in_background(format_alert(selected_user, analyzer.last_flags))
             compare_button.config(state=tk.DISABLED)
 
-    def display_results(data):
+    def import_export():
+        file_path = filedialog.askopenfilename(title="Select Lab Export",
+                                               filetypes=[("Lab exports", "*.csv *.json"), ("CSV", "*.csv"),
+                                                          ("FHIR Bundle", "*.json")])
+        if not file_path:
+            return
+        try:
+            # CSV exports without a patient column go to the selected user; FHIR bundles name their patients
+            default_user = user_dropdown_var.get().strip() or None if file_path.lower().endswith(".csv") else None
+            if service_client.enabled():
+                result = service_client.import_export(file_path, default_user)
+                stats, unmapped = result["stats"], result["unmapped"]
+            else:
+                stats, unmapped = import_file(file_path, analyzer.users, default_user=default_user)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to import {os.path.basename(file_path)}: {e}")
+            return
+        message = (f"Imported {stats['reports']} reports ({stats['values']} values).\n"
+                   f"Skipped {stats['duplicates']} already imported, {stats['unknown_user']} for unknown users "
+                   f"and {stats['bad_dates']} rows with unreadable dates.")
+        if unmapped:
+            message += f"\n{sum(unmapped.values())} results had codes or names not in keywords.txt."
+        messagebox.showinfo("Import", message)
+
+    def display_results(data, flags=()):
         results_text.delete(1.0, tk.END)
         if not data:
             results_text.insert(tk.END, "No values found.")
@@ -128,16 +134,52 @@ def show_dashboard(username):
             results_text.insert(tk.END, "Extracted Health Parameters:\n\n")
             for param, value in data.items():
                 results_text.insert(tk.END, f"\u2022 {param}: {value}\n")
+        if flags:
+            results_text.insert(tk.END, "\n\u26a0\ufe0f Flagged Values:\n\n")
+            for flag in flags:
+                results_text.insert(tk.END, f"\u2022 {flag['parameter']}: {flag['value']} ({flag['kind']}, {flag['detail']})\n")
+
+    def history_row(report):
+        return (report["timestamp"], report["filename"], report.get("assigned_to", "N/A"), len(report["results"]))
 
     def update_history():
         history_tree.delete(*history_tree.get_children())
         for i, report in enumerate(analyzer.report_history):
-            history_tree.insert("", tk.END, iid=str(i), values=(
-                report["timestamp"],
-                report["filename"],
-                report.get("assigned_to", "N/A"),
-                len(report["results"])
-            ))
+            history_tree.insert("", tk.END, iid=str(i), values=history_row(report))
+
+    pending_rows = []
+
+    def insert_pending_rows():
+        # a large import arrives as thousands of rows; insert them a chunk at a time so the window stays responsive
+        chunk = pending_rows[:HISTORY_INSERT_CHUNK]
+        del pending_rows[:HISTORY_INSERT_CHUNK]
+        for i in chunk:
+            history_tree.insert("", tk.END, iid=str(i), values=history_row(analyzer.report_history[i]))
+        if pending_rows:
+            history_tree.after(1, insert_pending_rows)
+
+    def on_report_event(event):
+        if event["action"] == "resync":
+            # events were missed while the window was busy or suspended; start over
+            pending_rows.clear()
+            analyzer.report_history = analyzer.load_report_history()
+            update_history()
+        elif event["action"] == "added":
+            reports = report_store.read_user_reports(event["user"], event["start"], event["count"])
+            first = len(analyzer.report_history)
+            analyzer.report_history.extend(reports)
+            if not pending_rows:
+                history_tree.after(1, insert_pending_rows)
+            pending_rows.extend(range(first, len(analyzer.report_history)))
+        elif event["action"] == "updated":
+            # values were filled in for existing reports; refresh just that user's rows
+            fresh = {(r["timestamp"], r["filename"]): r for r in report_store.load_user_reports(event["user"])}
+            for i, report in enumerate(analyzer.report_history):
+                if report.get("assigned_to") == event["user"]:
+                    report = fresh.get((report["timestamp"], report["filename"]), report)
+                    analyzer.report_history[i] = report
+                    if history_tree.exists(str(i)):
+                        history_tree.item(str(i), values=history_row(report))
 
     def compare_reports():
         selected_items = history_tree.selection()
@@ -146,7 +188,14 @@ def show_dashboard(username):
             return
         idx1, idx2 = int(selected_items[0]), int(selected_items[1])
         r1, r2 = analyzer.report_history[idx1], analyzer.report_history[idx2]
-        r1, r2 = sorted([r1, r2], key=lambda r: r["timestamp"])
+        if service_client.enabled():
+            try:
+                r1, r2 = service_client.compare(r1, r2)["reports"]
+            except service_client.ServiceError as e:
+                messagebox.showerror("Comparison", str(e))
+                return
+        else:
+            r1, r2 = sorted([r1, r2], key=lambda r: r["timestamp"])
 
         label1 = f"{r1['filename']} ({r1.get('report_date', 'N/A')})"
         label2 = f"{r2['filename']} ({r2.get('report_date', 'N/A')})"
@@ -169,6 +218,20 @@ def show_dashboard(username):
         results_text.delete(1.0, tk.END)
         results_text.insert(tk.END, "\n".join(output))
 
+    def open_report():
+        selected_items = history_tree.selection()
+        if len(selected_items) != 1:
+            return
+        report = analyzer.report_history[int(selected_items[0])]
+        path = blob_store.resolve(report.get("assigned_to", "N/A"), report["filename"])
+        if path is None:
+            messagebox.showwarning("Open Report", f"The PDF for {report['filename']} is not stored.")
+            return
+        if os.name == "nt":
+            os.startfile(path)
+        else:
+            subprocess.Popen(["open" if sys.platform == "darwin" else "xdg-open", path])
+
     root = tk.Tk()
     root.title(f"Admin Dashboard - {username}")
     root.geometry("1000x700")
@@ -186,12 +249,21 @@ def show_dashboard(username):
     tk.Label(upload_frame, text="Assign to User:", bg=LIGHT_BG, fg=TEXT_COLOR).pack(side=tk.LEFT, padx=5)
     user_dropdown_var = tk.StringVar(root)
     user_dropdown = ttk.Combobox(upload_frame, textvariable=user_dropdown_var,
-                                 values=analyzer.users, state="readonly", width=20)
+                                 values=analyzer.users[:SEARCH_LIMIT], width=20)
     if analyzer.users:
         user_dropdown_var.set(analyzer.users[0])
     user_dropdown.pack(side=tk.LEFT, padx=5)
+
+    def filter_users(event):
+        if event.keysym in ("Up", "Down", "Return", "Escape", "Tab"):
+            return
+        user_dropdown["values"] = get_directory().search(user_dropdown_var.get())
+
+    user_dropdown.bind("<KeyRelease>", filter_users)
     tk.Button(upload_frame, text="Browse PDF", command=browse_file,
               bg=PRIMARY_COLOR, fg="white", padx=10, pady=5).pack(side=tk.LEFT, padx=15)
+    tk.Button(upload_frame, text="Import Lab Export", command=import_export,
+              bg=PRIMARY_COLOR, fg="white", padx=10, pady=5).pack(side=tk.LEFT, padx=5)
 
     results_frame = tk.Frame(analysis_frame, bg=LIGHT_BG)
     results_frame.pack(expand=True, fill="both", padx=10, pady=10)
@@ -214,9 +286,74 @@ def show_dashboard(username):
                                command=compare_reports, state=tk.DISABLED,
                                bg=PRIMARY_COLOR, fg="white", width=25)
     compare_button.pack(pady=10)
-    history_tree.bind("<<TreeviewSelect>>",
-                      lambda event: compare_button.config(state=tk.NORMAL if len(history_tree.selection()) == 2 else tk.DISABLED))
+    open_button = tk.Button(history_frame, text="Open Selected PDF",
+                            command=open_report, state=tk.DISABLED,
+                            bg=PRIMARY_COLOR, fg="white", width=25)
+    open_button.pack(pady=(0, 10))
+
+    def on_history_select(event):
+        count = len(history_tree.selection())
+        compare_button.config(state=tk.NORMAL if count == 2 else tk.DISABLED)
+        open_button.config(state=tk.NORMAL if count == 1 else tk.DISABLED)
+
+    history_tree.bind("<<TreeviewSelect>>", on_history_select)
     update_history()
+    change_events.watch(history_tree, "reports", on_report_event)
+
+    # Population Tab
+    population_frame = ttk.Frame(notebook)
+    notebook.add(population_frame, text="Population")
+    population_controls = tk.Frame(population_frame, bg=LIGHT_BG, pady=10)
+    population_controls.pack(fill="x", padx=10, pady=10)
+
+    tk.Label(population_controls, text="Patient:", bg=LIGHT_BG, fg=TEXT_COLOR).pack(side=tk.LEFT, padx=5)
+    patient_var = tk.StringVar(root)
+    patient_dropdown = ttk.Combobox(population_controls, textvariable=patient_var,
+                                    values=analyzer.users[:SEARCH_LIMIT], width=20)
+    patient_dropdown.pack(side=tk.LEFT, padx=5)
+    patient_dropdown.bind("<KeyRelease>", lambda event: patient_dropdown.configure(
+        values=get_directory().search(patient_var.get())))
+
+    tk.Label(population_controls, text="Cohort:", bg=LIGHT_BG, fg=TEXT_COLOR).pack(side=tk.LEFT, padx=5)
+    cohort_var = tk.StringVar(root, value=ALL)
+    cohort_dropdown = ttk.Combobox(population_controls, textvariable=cohort_var, values=[ALL],
+                                   state="readonly", width=15)
+    cohort_dropdown.pack(side=tk.LEFT, padx=5)
+
+    band_columns = ["Parameter", "n"] + [f"P{p}" for p in BANDS] + ["Patient", "Percentile"]
+    population_tree = ttk.Treeview(population_frame, columns=band_columns, show="headings")
+    for col in band_columns:
+        population_tree.heading(col, text=col)
+        population_tree.column(col, width=180 if col == "Parameter" else 80, anchor="w" if col == "Parameter" else "e")
+    population_tree.pack(expand=True, fill="both", padx=10, pady=10)
+
+    def show_population():
+        population = PopulationStats()
+        cohort_dropdown["values"] = population.cohorts()
+        cohort = cohort_var.get() or ALL
+        patient = patient_var.get().strip()
+        try:
+            latest = analyzer.latest_values(patient) if patient in get_directory() else {}
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load patient reports: {e}")
+            latest = {}
+        population_tree.delete(*population_tree.get_children())
+        for param in population.params(cohort):
+            bands = population.bands(param, cohort)
+            value = latest.get(param)
+            rank = population.rank(param, value, cohort) if value is not None else None
+            population_tree.insert("", tk.END, values=(
+                param,
+                population.count(param, cohort),
+                *(f"{bands[p]:.4g}" for p in BANDS),
+                "" if value is None else value,
+                "" if rank is None else f"{rank:.0f}%"
+            ))
+
+    cohort_dropdown.bind("<<ComboboxSelected>>", lambda event: show_population())
+    tk.Button(population_controls, text="Show", command=show_population,
+              bg=PRIMARY_COLOR, fg="white", padx=10, pady=5).pack(side=tk.LEFT, padx=15)
+    show_population()
 
     # Reminder Tab
     reminder_tab = ttk.Frame(notebook)
@@ -242,18 +379,21 @@ def show_dashboard(username):
             "date": date_entry.get_date().strftime("%Y-%m-%d")
         }
         try:
-            if not os.path.exists("reminders.json"):
+            if service_client.enabled():
+                service_client.add_reminder(reminder)
+            else:
+                if not os.path.exists("reminders.json"):
+                    with open("reminders.json", "w") as f:
+                        json.dump([], f)
+                with open("reminders.json", "r") as f:
+                    data = json.load(f)
+                data.append(reminder)
                 with open("reminders.json", "w") as f:
-                    json.dump([], f)
-            with open("reminders.json", "r") as f:
-                data = json.load(f)
-            data.append(reminder)
-            with open("reminders.json", "w") as f:
-                json.dump(data, f, indent=4)
+                    json.dump(data, f, indent=4)
+                change_events.publish("reminders", {"action": "added", "reminder": reminder})
             messagebox.showinfo("Success", "Reminder saved successfully!")
-            send_telegram_message(
+            notify_in_background(
                 f"\u2705 Reminder added\n\n• {reminder['title']}\n• {reminder['type']}\n• Date: {reminder['date']}")
-            load_reminders()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save reminder: {e}")
 
@@ -268,10 +408,21 @@ def show_dashboard(username):
     def load_reminders():
         for row in reminder_list.get_children():
             reminder_list.delete(row)
-        if os.path.exists("reminders.json"):
+        if service_client.enabled():
+            for r in service_client.reminders():
+                reminder_list.insert("", tk.END, values=(r["title"], r["type"], r["date"]))
+        elif os.path.exists("reminders.json"):
             with open("reminders.json", "r") as f:
                 for r in json.load(f):
                     reminder_list.insert("", tk.END, values=(r["title"], r["type"], r["date"]))
 
+    def on_reminder_event(event):
+        if event["action"] == "resync":
+            load_reminders()
+        elif event["action"] == "added":
+            r = event["reminder"]
+            reminder_list.insert("", tk.END, values=(r["title"], r["type"], r["date"]))
+
     load_reminders()
+    change_events.watch(reminder_list, "reminders", on_reminder_event)
     root.mainloop()
@@ -3,16 +3,18 @@ from tkinter import messagebox, filedialog, ttk
 from tkcalendar import DateEntry
 import os
 import json
-import shutil
-import re
-import pdfplumber
 from datetime import datetime
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from telegram_notifier import send_telegram_message
+from telegram_notifier import notify_in_background
+from measurement_store import ensure_user_store
+import report_store
+import change_events
+from anomaly import format_alert
+import service_client
+from ingest import ingest_report, BASIC_PATTERN, BASIC_KEYWORDS
 
-KEY_PARAMS = ["Hemoglobin", "Glucose", "Bilirubin"]
-REPORT_HISTORY_FILE = "report_history.json"
+KEY_PARAMS = BASIC_KEYWORDS
 
 # Colors for enhanced UI
 PRIMARY_COLOR = "#32de84"        # main green
@@ -22,27 +24,6 @@ FRAME_BG = "#c0f2dc"             # container/frame bg
 TEXT_COLOR = "#1f5131"           # darker text
 
 
-def extract_basic_values(pdf_path):
-    results = {}
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = " ".join(page.extract_text() or "" for page in pdf.pages)
-
-        normalized = re.sub(r"\s+", " ", text).lower()
-        for param in KEY_PARAMS:
-            pattern = rf"{param.lower()}.*?(\d+(?:[.,]\d+)?)"
-            match = re.search(pattern, normalized)
-            if match:
-                try:
-                    val = float(match.group(1).replace(',', '.'))
-                    results[param] = val
-                except ValueError:
-                    continue
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to extract values: {e}")
-    return results
-
-
 def show_dashboard(username):
     root = tk.Tk()
     root.title(f"Health Analyzer - {username}")
@@ -67,54 +48,41 @@ def show_dashboard(username):
         file_path = filedialog.askopenfilename(title="Select Health Report PDF", filetypes=[("PDF Files", "*.pdf")])
         if file_path:
             try:
-                os.makedirs(f"user_reports/{username}", exist_ok=True)
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 new_filename = f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-                dest_path = f"user_reports/{username}/{new_filename}"
-                shutil.copy(file_path, dest_path)
-
-                extracted = extract_basic_values(file_path)
-                report_entry = {
-                    "timestamp": timestamp,
-                    "filename": new_filename,
-                    "assigned_to": username,
-                    "results": extracted
-                }
-
-                if not os.path.exists(REPORT_HISTORY_FILE):
-                    with open(REPORT_HISTORY_FILE, "w") as f:
-                        json.dump([], f)
-
-                with open(REPORT_HISTORY_FILE, "r") as f:
-                    history = json.load(f)
-                history.append(report_entry)
-                with open(REPORT_HISTORY_FILE, "w") as f:
-                    json.dump(history, f, indent=4)
+                if service_client.enabled():
+                    report_entry = service_client.ingest(file_path, username, new_filename, basic=True)
+                else:
+                    report_entry, _ = ingest_report(file_path, username, KEY_PARAMS,
+                                                    filename=new_filename, template=BASIC_PATTERN)
+                    report_store.append_report(report_entry)
 
                 messagebox.showinfo("Success", "Report uploaded successfully!")
+                if report_entry["flags"]:
+                    alert = format_alert(username, report_entry["flags"])
+                    messagebox.showwarning("Health Alert", alert)
+                    notify_in_background(alert)
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to upload: {e}")
 
     def show_trends():
-        if not os.path.exists(REPORT_HISTORY_FILE):
-            messagebox.showwarning("No Data", "No report data found.")
-            return
-
-        with open(REPORT_HISTORY_FILE, "r") as f:
-            all_reports = json.load(f)
-
-        user_reports = [r for r in all_reports if r.get("assigned_to") == username and "results" in r]
-        if not user_reports:
-            messagebox.showinfo("No Reports", "No reports found.")
-            return
-
-        user_reports.sort(key=lambda x: datetime.strptime(x["timestamp"], "%Y-%m-%d %H:%M:%S"))
-        dates = [datetime.strptime(r["timestamp"], "%Y-%m-%d %H:%M:%S") for r in user_reports]
+        if service_client.enabled():
+            trends = service_client.trends(username, KEY_PARAMS)
+            if not trends["dates"]:
+                messagebox.showinfo("No Reports", "No reports found.")
+                return
+            dates = [datetime.strptime(t, "%Y-%m-%d %H:%M:%S") for t in trends["dates"]]
+            series = trends["series"]
+        else:
+            with ensure_user_store(username) as store:
+                rows = store.user_rows(username)
+                if not rows:
+                    messagebox.showinfo("No Reports", "No reports found.")
+                    return
+                dates = [store.timestamp(row) for row in rows]
+                series = {param: [store.value(row, param) for row in rows] for param in KEY_PARAMS}
 
         fig, ax = plt.subplots(figsize=(8, 4))
-        for param in KEY_PARAMS:
-            values = [r["results"].get(param, None) for r in user_reports]
-            ax.plot(dates, values, marker='o', label=param)
+        lines = {param: ax.plot(dates, values, marker='o', label=param)[0] for param, values in series.items()}
 
         ax.set_title("Health Parameter Trends", fontsize=12)
         ax.set_xlabel("Date")
@@ -128,6 +96,28 @@ def show_dashboard(username):
         canvas.draw()
         canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
 
+        def add_point(event):
+            if event["action"] == "resync":
+                reports = report_store.load_user_reports(username)
+                dates.clear()
+                for column in series.values():
+                    column.clear()
+            elif event["action"] == "added" and event.get("user") == username:
+                reports = report_store.read_user_reports(username, event["start"], event["count"])
+            else:
+                return
+            for report in reports:
+                dates.append(datetime.strptime(report["timestamp"], "%Y-%m-%d %H:%M:%S"))
+                for param in lines:
+                    series[param].append(report.get("results", {}).get(param))
+            for param, line in lines.items():
+                line.set_data(dates, series[param])
+            ax.relim()
+            ax.autoscale_view()
+            canvas.draw_idle()
+
+        change_events.watch(top, "reports", add_point)
+
     tk.Button(upload_frame, text="Upload PDF", command=upload_report,
               bg=PRIMARY_COLOR, fg="white", font=("Segoe UI", 10, "bold"), relief="flat",
               activebackground=ACCENT_COLOR, padx=10, pady=5).pack(pady=5)
@@ -163,38 +153,30 @@ def show_dashboard(username):
 
     def show_monthly_summary(root, username):
         try:
-            if not os.path.exists(REPORT_HISTORY_FILE):
-                messagebox.showwarning("No Data", "No report data found.")
-                return
-
-            with open(REPORT_HISTORY_FILE, "r") as f:
-                all_reports = json.load(f)
-
-            user_reports = [
-                r for r in all_reports if r.get("assigned_to") == username and "results" in r
-            ]
-
-            if not user_reports:
+            if service_client.enabled():
+                summary_data = service_client.summary(username, KEY_PARAMS)
+            else:
+                with ensure_user_store(username) as store:
+                    months = {}
+                    for row in store.user_rows(username):
+                        month = months.setdefault(store.timestamp(row).strftime("%Y-%m"), {})
+                        for param in KEY_PARAMS:
+                            val = store.value(row, param)
+                            if val is not None:
+                                month.setdefault(param, []).append(val)
+                summary_data = {
+                    month: {param: {"avg": sum(v) / len(v), "min": min(v), "max": max(v)} for param, v in values.items()}
+                    for month, values in months.items()
+                }
+            if not summary_data:
                 messagebox.showinfo("No Reports", "No reports found for summary.")
                 return
 
-            summary_data = {}
-            for report in user_reports:
-                month = datetime.strptime(report["timestamp"], "%Y-%m-%d %H:%M:%S").strftime("%Y-%m")
-                if month not in summary_data:
-                    summary_data[month] = {param: [] for param in KEY_PARAMS}
-                for param in KEY_PARAMS:
-                    val = report["results"].get(param)
-                    if isinstance(val, (int, float)):
-                        summary_data[month][param].append(val)
-
             output = ["📅 Monthly Summary:\n"]
             for month, params in sorted(summary_data.items()):
                 output.append(f"Month: {month}")
-                for param, values in params.items():
-                    if values:
-                        avg = sum(values) / len(values)
-                        output.append(f"• {param}: Avg = {avg:.2f}, Min = {min(values)}, Max = {max(values)}")
+                for param, stats in params.items():
+                    output.append(f"• {param}: Avg = {stats['avg']:.2f}, Min = {stats['min']}, Max = {stats['max']}")
                 output.append("")
 
             messagebox.showinfo("Monthly Summary", "\n".join(output))
@@ -204,16 +186,10 @@ def show_dashboard(username):
 
     def show_parameter_summary(root, username):
         try:
-            if not os.path.exists(REPORT_HISTORY_FILE):
-                messagebox.showwarning("No Data", "No report data found.")
-                return
-
-            with open(REPORT_HISTORY_FILE, "r") as f:
-                all_reports = json.load(f)
-
-            user_reports = [
-                r for r in all_reports if r.get("assigned_to") == username and "results" in r
-            ]
+            if service_client.enabled():
+                user_reports = service_client.reports(username)
+            else:
+                user_reports = [r for r in report_store.load_user_reports(username) if "results" in r]
 
             if not user_reports:
                 messagebox.showinfo("No Reports", "No reports found.")
@@ -240,6 +216,22 @@ def show_dashboard(username):
             param_box.pack(pady=5)
             param_box.set("Hemoglobin")
 
+            def add_report(event):
+                if event["action"] == "resync":
+                    reports = report_store.load_user_reports(username)
+                    user_reports.clear()
+                elif event["action"] == "added" and event.get("user") == username:
+                    reports = report_store.read_user_reports(username, event["start"], event["count"])
+                else:
+                    return
+                for report in reports:
+                    if "results" in report:
+                        user_reports.append(report)
+                        all_params.update(report["results"])
+                param_box["values"] = sorted(all_params)
+
+            change_events.watch(param_window, "reports", add_report)
+
             def show_plot():
                 param = param_var.get()
                 dates, values = [], []
@@ -268,6 +260,28 @@ def show_dashboard(username):
                 canvas = FigureCanvasTkAgg(fig, master=chart_win)
                 canvas.draw()
                 canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+                line = ax.get_lines()[0]
+
+                def add_point(event):
+                    if event["action"] == "resync":
+                        reports = report_store.load_user_reports(username)
+                        dates.clear()
+                        values.clear()
+                    elif event["action"] == "added" and event.get("user") == username:
+                        reports = report_store.read_user_reports(username, event["start"], event["count"])
+                    else:
+                        return
+                    for report in reports:
+                        val = report.get("results", {}).get(param)
+                        if isinstance(val, (int, float)):
+                            dates.append(datetime.strptime(report["timestamp"], "%Y-%m-%d %H:%M:%S"))
+                            values.append(val)
+                    line.set_data(dates, values)
+                    ax.relim()
+                    ax.autoscale_view()
+                    canvas.draw_idle()
+
+                change_events.watch(chart_win, "reports", add_point)
 
             tk.Button(param_window, text="📊 Show Summary", command=show_plot,
                       bg=PRIMARY_COLOR, fg="white", font=("Segoe UI", 10, "bold"),
@@ -284,19 +298,23 @@ def show_dashboard(username):
             "date": date_entry.get_date().strftime("%Y-%m-%d")
         }
         try:
-            if not os.path.exists("reminders.json"):
-                with open("reminders.json", "w") as f:
-                    json.dump([], f)
+            if service_client.enabled():
+                service_client.add_reminder(reminder)
+            else:
+                if not os.path.exists("reminders.json"):
+                    with open("reminders.json", "w") as f:
+                        json.dump([], f)
 
-            with open("reminders.json", "r") as f:
-                data = json.load(f)
+                with open("reminders.json", "r") as f:
+                    data = json.load(f)
 
-            data.append(reminder)
-            with open("reminders.json", "w") as f:
-                json.dump(data, f, indent=4)
+                data.append(reminder)
+                with open("reminders.json", "w") as f:
+                    json.dump(data, f, indent=4)
+                change_events.publish("reminders", {"action": "added", "reminder": reminder})
 
             messagebox.showinfo("Success", "Reminder saved successfully!")
-            send_telegram_message(
+            notify_in_background(
                 f"\u2705 Hi {username}, your {reminder['type']} reminder is scheduled.\n\nTitle: {reminder['title']}\nDate: {reminder['date']}"
             )
         except Exception as e:
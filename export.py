@@ -0,0 +1,121 @@
+import argparse
+import csv
+import sys
+from datetime import datetime
+from itertools import islice
+import report_store
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+KEYWORDS_FILE = "keywords.txt"
+CHUNK_SIZE = 10000
+BASE_COLUMNS = ["timestamp", "filename", "assigned_to", "report_date"]
+
+
+def load_parameters():
+    with open(KEYWORDS_FILE, "r") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def iter_reports(users=None, since=None, until=None):
+    """
+    Streams report entries matching the filters; since/until are inclusive "YYYY-MM-DD" dates.
+    Only the history shards of the requested users are read.
+    """
+    for user in users or report_store.users():
+        for report in report_store.iter_user_reports(user):
+            if "results" not in report:
+                continue
+            day = report["timestamp"][:10]
+            if (since and day < since) or (until and day > until):
+                continue
+            yield report
+
+
+def iter_chunks(reports, params, chunk_size=CHUNK_SIZE):
+    """
+    Flattens reports into column lists, chunk_size rows at a time.
+    """
+    reports = iter(reports)
+    while True:
+        chunk = list(islice(reports, chunk_size))
+        if not chunk:
+            return
+        columns = {name: [r.get(name) for r in chunk] for name in BASE_COLUMNS}
+        for param in params:
+            columns[param] = [r["results"].get(param) for r in chunk]
+        yield columns
+
+
+def export_csv(out_path, reports, params, chunk_size=CHUNK_SIZE):
+    rows = 0
+    with open(out_path, "w", newline='', encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(BASE_COLUMNS + params)
+        for columns in iter_chunks(reports, params, chunk_size):
+            batch = list(zip(*columns.values()))
+            writer.writerows(batch)
+            rows += len(batch)
+    return rows
+
+
+def _arrow_schema(params):
+    fields = [pa.field("timestamp", pa.timestamp("s"))]
+    fields += [pa.field(name, pa.string()) for name in BASE_COLUMNS[1:]]
+    fields += [pa.field(param, pa.float64()) for param in params]
+    return pa.schema(fields)
+
+
+def export_arrow(out_path, reports, params, chunk_size=CHUNK_SIZE, fmt="parquet"):
+    if pa is None:
+        raise RuntimeError("pyarrow is required for Parquet/Arrow export (pip install pyarrow)")
+    schema = _arrow_schema(params)
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(out_path, schema)
+        write = writer.write_table
+    else:
+        writer = pa_ipc.new_file(out_path, schema)
+        write = writer.write_batch
+    rows = 0
+    try:
+        for columns in iter_chunks(reports, params, chunk_size):
+            columns["timestamp"] = [datetime.strptime(t, "%Y-%m-%d %H:%M:%S") for t in columns["timestamp"]]
+            batch = pa.RecordBatch.from_pydict(columns, schema=schema)
+            write(pa.Table.from_batches([batch]) if fmt == "parquet" else batch)
+            rows += batch.num_rows
+    finally:
+        writer.close()
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export report history for offline analytics.")
+    parser.add_argument("output", help="destination file")
+    parser.add_argument("--format", choices=["csv", "parquet", "arrow"], default="csv")
+    parser.add_argument("--user", action="append", help="only this user (repeatable)")
+    parser.add_argument("--since", help="first day to include, YYYY-MM-DD")
+    parser.add_argument("--until", help="last day to include, YYYY-MM-DD")
+    parser.add_argument("--params", help="comma-separated parameters (default: keywords.txt)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    params = [p.strip() for p in args.params.split(",")] if args.params else load_parameters()
+    reports = iter_reports(args.user, args.since, args.until)
+    try:
+        if args.format == "csv":
+            rows = export_csv(args.output, reports, params, args.chunk_size)
+        else:
+            rows = export_arrow(args.output, reports, params, args.chunk_size, args.format)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ Exported {rows} reports x {len(params)} parameters to {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+SEND_PATH = re.compile(r"^/bot[^/]+/sendMessage$")
+
+
+class FakeTelegramState:
+    """
+    Behaviour knobs and counters for the fake Bot API.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0,
+                 retry_after=1, per_chat_interval=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.per_chat_interval = per_chat_interval
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.last_by_chat = {}
+        self.counts = {"received": 0, "ok": 0, "errors": 0, "rate_limited": 0}
+        self.messages = []
+
+    def decide(self, chat_id):
+        with self.lock:
+            self.counts["received"] += 1
+            now = time.monotonic()
+            too_fast = now - self.last_by_chat.get(chat_id, -1e9) < self.per_chat_interval
+            roll = self.random.random()
+            if too_fast or roll < self.rate_limit_rate:
+                self.counts["rate_limited"] += 1
+                return 429
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.counts["errors"] += 1
+                return 500
+            self.last_by_chat[chat_id] = now
+            self.counts["ok"] += 1
+            return 200
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        state = self.server.state
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        form = parse_qs(self.rfile.read(length).decode("utf-8"))
+        if not SEND_PATH.match(self.path):
+            self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+            return
+        chat_id = form.get("chat_id", [""])[0]
+        text = form.get("text", [""])[0]
+        if not chat_id or not text:
+            self._reply(400, {"ok": False, "error_code": 400, "description": "Bad Request: message text is empty"})
+            return
+
+        delay = state.latency + (state.random.uniform(0, state.jitter) if state.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        status = state.decide(chat_id)
+        if status == 429:
+            self._reply(429, {"ok": False, "error_code": 429,
+                              "description": f"Too Many Requests: retry after {state.retry_after}",
+                              "parameters": {"retry_after": state.retry_after}})
+        elif status == 500:
+            self._reply(500, {"ok": False, "error_code": 500, "description": "Internal Server Error"})
+        else:
+            with state.lock:
+                state.messages.append((chat_id, len(text)))
+                message_id = len(state.messages)
+            self._reply(200, {"ok": True, "result": {"message_id": message_id, "chat": {"id": chat_id},
+                                                     "date": int(time.time()), "text": text}})
+
+
+def start_fake_server(host="127.0.0.1", port=0, **knobs):
+    """
+    Starts the fake in a background thread. Returns (server, base_url); call server.shutdown() to stop.
+    """
+    server = ThreadingHTTPServer((host, port), FakeTelegramHandler)
+    server.daemon_threads = True
+    server.state = FakeTelegramState(**knobs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Telegram Bot API sendMessage endpoint.")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--per-chat-interval", type=float, default=0.0,
+                        help="answer 429 when a chat is messaged faster than this (seconds)")
+    args = parser.parse_args()
+    fake, url = start_fake_server(port=args.port, latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+                                  error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                                  retry_after=args.retry_after, per_chat_interval=args.per_chat_interval)
+    print(f"🤖 Fake Telegram API on {url} (set TELEGRAM_API_URL={url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.shutdown()
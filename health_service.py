@@ -0,0 +1,311 @@
+import asyncio
+import hmac
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+from file_utils import load_json, save_json
+import change_events
+import report_store
+from ingest import parse_report, record_report, KEYWORD_PATTERN, BASIC_PATTERN, BASIC_KEYWORDS
+from structured_import import import_file
+from service_client import service_token
+from user_directory import get_directory
+
+EVENT_POLL_SECONDS = 1.0
+HOST = "127.0.0.1"
+PORT = 8765
+REMINDER_FILE = "reminders.json"
+KEYWORDS_FILE = "keywords.txt"
+MAX_BODY = 1024 * 1024
+# browsers send whatever Host they looked up, so a DNS-rebinding page shows up here
+ALLOWED_HOSTS = {"127.0.0.1", "localhost", "::1"}
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden",
+           404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class HealthStore:
+    """
+    The one warm copy of users, keywords, report history and reminders shared by every client.
+    Reads are served from memory; writes go through a lock and are persisted off the event loop.
+    """
+
+    def __init__(self, workers=None):
+        with open(KEYWORDS_FILE, "r") as f:
+            self.keywords = [line.strip() for line in f if line.strip()]
+        self.reload("reports")
+        self.reload("reminders")
+        self.users = get_directory()
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self.lock = asyncio.Lock()
+        self.token = service_token(create=True)
+        self.cursors = {topic: change_events.EventCursor(topic) for topic in ("reports", "reminders")}
+
+    def apply_events(self):
+        """
+        Folds in reports and reminders written by other processes (watch folder, importers,
+        dashboards not using the service) without re-reading the stores, unless events were missed.
+        """
+        for topic, cursor in self.cursors.items():
+            for event in cursor.poll():
+                if event.get("pid") == os.getpid():
+                    continue
+                if event["action"] == "resync":
+                    # fell more than one log rotation behind: reload instead of guessing
+                    self.reload(topic)
+                elif topic == "reminders" and event["action"] == "added":
+                    self.reminders.append(event["reminder"])
+                elif event["action"] == "added":
+                    reports = report_store.read_user_reports(event["user"], event["start"], event["count"])
+                    self.history.extend(reports)
+                    self.by_user.setdefault(event["user"], []).extend(reports)
+                elif event["action"] == "updated":
+                    user = event["user"]
+                    self.by_user[user] = report_store.load_user_reports(user)
+                    self.history = [r for r in self.history if r.get("assigned_to") != user] + self.by_user[user]
+                    self.history.sort(key=lambda r: r["timestamp"])
+
+    def reload(self, topic):
+        if topic == "reminders":
+            self.reminders = load_json(REMINDER_FILE, [])
+            return
+        self.history = report_store.load_all_reports()
+        self.by_user = {}
+        for report in self.history:
+            self.by_user.setdefault(report.get("assigned_to"), []).append(report)
+
+    async def follow_events(self):
+        while True:
+            await asyncio.sleep(EVENT_POLL_SECONDS)
+            async with self.lock:
+                self.apply_events()
+
+    def user_reports(self, user):
+        return [r for r in self.by_user.get(user, []) if "results" in r]
+
+    async def _persist(self, write, *args):
+        await asyncio.get_running_loop().run_in_executor(None, write, *args)
+
+    async def ingest(self, path, user, filename=None, basic=False):
+        if user not in self.users:
+            raise HttpError(400, f"Unknown user: {user}")
+        if not os.path.isfile(path):
+            raise HttpError(400, f"File not found: {path}")
+        loop = asyncio.get_running_loop()
+        template = BASIC_PATTERN if basic else KEYWORD_PATTERN
+        keywords = BASIC_KEYWORDS if basic else self.keywords
+        # the pool already spreads reports across cores, so each one is parsed in a single process
+        digest, text, results = await loop.run_in_executor(self.pool, parse_report, path, keywords, template, 1)
+        async with self.lock:
+            # refs, anomaly state and population sketches are written under file locks other processes share
+            entry = await loop.run_in_executor(None, record_report, digest, text, results, user,
+                                               filename or os.path.basename(path))
+            self.history.append(entry)
+            self.by_user.setdefault(user, []).append(entry)
+            await self._persist(report_store.append_report, entry)
+        return entry
+
+    async def import_export(self, path, default_user=None):
+        if not os.path.isfile(path):
+            raise HttpError(400, f"File not found: {path}")
+        if default_user and default_user not in self.users:
+            raise HttpError(400, f"Unknown user: {default_user}")
+        # the worker's "added" events bring the imported reports into memory on the next poll
+        stats, unmapped = await asyncio.get_running_loop().run_in_executor(
+            self.pool, _import_in_worker, path, default_user)
+        return {"stats": stats, "unmapped": unmapped}
+
+    def trends(self, user, params):
+        reports = self.user_reports(user)
+        return {
+            "dates": [r["timestamp"] for r in reports],
+            "series": {param: [r["results"].get(param) for r in reports] for param in params}
+        }
+
+    def monthly_summary(self, user, params):
+        months = {}
+        for report in self.user_reports(user):
+            month = report["timestamp"][:7]
+            for param in params:
+                value = report["results"].get(param)
+                if isinstance(value, (int, float)):
+                    months.setdefault(month, {}).setdefault(param, []).append(value)
+        return {
+            month: {param: {"avg": sum(v) / len(v), "min": min(v), "max": max(v)} for param, v in values.items()}
+            for month, values in sorted(months.items())
+        }
+
+    def find_report(self, key):
+        user, timestamp, filename = key
+        for report in self.by_user.get(user, []):
+            if report["timestamp"] == timestamp and report["filename"] == filename:
+                return report
+        return None
+
+    def compare(self, first, second):
+        reports = [self.find_report(first), self.find_report(second)]
+        if None in reports:
+            # written by another process since the last poll
+            self.apply_events()
+            reports = [self.find_report(first), self.find_report(second)]
+        if None in reports:
+            raise HttpError(404, "No such report")
+        r1, r2 = sorted(reports, key=lambda r: r["timestamp"])
+        params = sorted(set(r1["results"]) | set(r2["results"]))
+        return {
+            "reports": [r1, r2],
+            "rows": [[param, r1["results"].get(param), r2["results"].get(param)] for param in params]
+        }
+
+    async def add_reminder(self, reminder):
+        missing = [key for key in ("title", "type", "date") if not reminder.get(key)]
+        if missing:
+            raise HttpError(400, f"Missing fields: {', '.join(missing)}")
+        datetime.strptime(reminder["date"], "%Y-%m-%d")
+        async with self.lock:
+            self.reminders.append(reminder)
+            await self._persist(save_json, REMINDER_FILE, list(self.reminders))
+            change_events.publish("reminders", {"action": "added", "reminder": reminder})
+        return reminder
+
+
+def _import_in_worker(path, default_user):
+    return import_file(path, get_directory().names(), default_user=default_user)
+
+
+def _report_key(query, name):
+    try:
+        key = json.loads(query[name][0])
+    except (KeyError, ValueError):
+        key = None
+    if not (isinstance(key, list) and len(key) == 3 and all(isinstance(part, str) for part in key)):
+        raise HttpError(400, f'compare needs {name} as ["user", "timestamp", "filename"]')
+    return key
+
+
+def _authorize(store, headers):
+    host = urlsplit("//" + headers.get("host", "")).hostname
+    if host not in ALLOWED_HOSTS:
+        raise HttpError(403, "Host not allowed")
+    if "origin" in headers:
+        raise HttpError(403, "Browser requests are not accepted")
+    if not hmac.compare_digest(headers.get("authorization", "").encode(), f"Bearer {store.token}".encode()):
+        raise HttpError(401, "Missing or wrong service token")
+
+
+def _param_list(query, default):
+    value = query.get("params", [""])[0]
+    return [p for p in value.split(",") if p] or default
+
+
+async def route(store, method, path, query, body):
+    user = query.get("user", [""])[0]
+    if path == "/health":
+        return 200, {"reports": len(store.history), "reminders": len(store.reminders)}
+    if path == "/ingest" and method == "POST":
+        return 201, await store.ingest(body.get("path", ""), body.get("user", ""),
+                                       body.get("filename"), body.get("basic", False))
+    if path == "/import" and method == "POST":
+        return 201, await store.import_export(body.get("path", ""), body.get("default_user"))
+    if path == "/reports" and method == "GET":
+        return 200, store.user_reports(user) if user else store.history
+    if path == "/trends" and method == "GET":
+        return 200, store.trends(user, _param_list(query, store.keywords))
+    if path == "/summary" and method == "GET":
+        return 200, store.monthly_summary(user, _param_list(query, store.keywords))
+    if path == "/compare" and method == "GET":
+        return 200, store.compare(_report_key(query, "a"), _report_key(query, "b"))
+    if path == "/reminders":
+        if method == "GET":
+            return 200, store.reminders
+        if method == "POST":
+            return 201, await store.add_reminder(body)
+        raise HttpError(405, "Use GET or POST")
+    raise HttpError(404, f"No route for {method} {path}")
+
+
+async def handle_client(store, reader, writer):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            try:
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            except ValueError:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            body_read = False
+            try:
+                _authorize(store, headers)
+                try:
+                    length = int(headers.get("content-length", 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    raise HttpError(400, "Invalid Content-Length")
+                if length > MAX_BODY:
+                    raise HttpError(413, "Request body too large")
+                raw = await reader.readexactly(length) if length else b""
+                body_read = True
+                body = json.loads(raw) if raw else {}
+                url = urlsplit(target)
+                status, payload = await route(store, method, url.path, parse_qs(url.query), body)
+            except HttpError as e:
+                status, payload = e.status, {"error": str(e)}
+            except (ValueError, json.JSONDecodeError) as e:
+                status, payload = 400, {"error": str(e)}
+            except Exception as e:
+                status, payload = 500, {"error": str(e)}
+
+            data = json.dumps(payload).encode("utf-8")
+            # a body that was rejected unread leaves the stream unusable
+            keep_alive = headers.get("connection", "").lower() != "close" and body_read
+            writer.write(
+                f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host=HOST, port=PORT, workers=None):
+    store = HealthStore(workers)
+    server = await asyncio.start_server(lambda r, w: handle_client(store, r, w), host, port)
+    follower = asyncio.get_running_loop().create_task(store.follow_events())
+    print(f"🩺 Health service listening on http://{host}:{port} "
+          f"({len(store.history)} reports, {len(store.reminders)} reminders)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        follower.cancel()
+        store.pool.shutdown()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve(port=int(sys.argv[1]) if len(sys.argv) > 1 else PORT))
+    except KeyboardInterrupt:
+        pass
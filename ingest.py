@@ -0,0 +1,171 @@
+import hashlib
+import io
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import pdfplumber
+import blob_store
+import text_cache
+from anomaly import get_engine
+from population import get_population
+
+# Same first-match rule as the admin analyzer; BASIC_PATTERN is the looser one used on the user dashboard
+KEYWORD_PATTERN = r"{keyword}\s*.*?(\d+(?:[.,]\d+)*)"
+BASIC_PATTERN = r"{keyword}.*?(\d+(?:[.,]\d+)?)"
+BASIC_KEYWORDS = ["Hemoglobin", "Glucose", "Bilirubin"]
+
+# Below either threshold a PDF is parsed in-process; pool start-up would cost more than it saves
+PARALLEL_MIN_BYTES = 2 * 1024 * 1024
+PARALLEL_MIN_PAGES = 40
+PAGES_PER_TASK = 8
+
+IO_STATS = {
+    "reports": 0,
+    "source_bytes_read": 0,
+    "bytes_hashed": 0,
+    "blob_bytes_written": 0,
+    "blob_bytes_deduplicated": 0,
+    "parse_bytes_from_buffer": 0,
+    "text_cache_bytes_written": 0,
+    "pages_parsed_in_parallel": 0,
+    "source_bytes_saved": 0,
+}
+
+
+def reset_io_stats():
+    for key in IO_STATS:
+        IO_STATS[key] = 0
+
+
+def extract_date_from_text(text):
+    date_patterns = [
+        r"\b\d{2}[-/]\d{2}[-/]\d{4}\b",
+        r"\b\d{4}[-/]\d{2}[-/]\d{2}\b",
+    ]
+    for pattern in date_patterns:
+        match = re.search(pattern, text)
+        if match:
+            return match.group(0)
+    return "Unknown"
+
+
+def read_source(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    IO_STATS["source_bytes_read"] += len(data)
+    return data
+
+
+def _extract_page_range(job):
+    path, start, stop = job
+    with pdfplumber.open(path) as pdf:
+        return [page.extract_text() or "" for page in pdf.pages[start:stop]]
+
+
+def extract_text(data, path=None, workers=None):
+    """
+    Runs pdfplumber over an in-memory copy of the PDF instead of reopening the source path.
+    Large documents with a path on disk are split into page ranges across a process pool;
+    pages are joined in order, so the text (and every first match in it) is unchanged.
+    """
+    IO_STATS["parse_bytes_from_buffer"] += len(data)
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        page_count = len(pdf.pages)
+        if path is None or len(data) < PARALLEL_MIN_BYTES or page_count < PARALLEL_MIN_PAGES \
+                or (workers or os.cpu_count() or 1) < 2:
+            return " ".join(page.extract_text() or "" for page in pdf.pages)
+
+    jobs = [(path, start, min(start + PAGES_PER_TASK, page_count))
+            for start in range(0, page_count, PAGES_PER_TASK)]
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), len(jobs))) as pool:
+        pages = [text for chunk in pool.map(_extract_page_range, jobs) for text in chunk]
+    IO_STATS["pages_parsed_in_parallel"] += page_count
+    return " ".join(pages)
+
+
+def normalize_text(text):
+    return re.sub(r"\s+", " ", text).lower()
+
+
+def match_keywords(normalized_text, keywords, template=KEYWORD_PATTERN):
+    results = {}
+    for keyword in keywords:
+        match = re.search(template.format(keyword=re.escape(keyword.lower())), normalized_text)
+        if match:
+            try:
+                results[keyword] = float(match.group(1).replace(',', '.'))
+            except ValueError:
+                continue
+    return results
+
+
+def parse_report(path, keywords, template=KEYWORD_PATTERN, workers=None):
+    """
+    Reads the source PDF exactly once, then hashes, stores and parses that same buffer.
+    Touches no per-user state, so it is safe to run in a worker process; callers that are
+    already a pool worker pass workers=1 so large PDFs do not start a pool of their own.
+    Returns (digest, text, results).
+    """
+    data = read_source(path)
+    digest = hashlib.sha256(data).hexdigest()
+    IO_STATS["bytes_hashed"] += len(data)
+
+    written = blob_store.put_bytes(digest, data)
+    IO_STATS["blob_bytes_written"] += written
+    IO_STATS["blob_bytes_deduplicated"] += len(data) - written
+
+    # page workers open the stored blob, which is byte-identical to the source
+    text = extract_text(data, blob_store.blob_path(digest), workers)
+    # copy + reparse used to read the source twice
+    IO_STATS["source_bytes_saved"] += len(data)
+    IO_STATS["reports"] += 1
+
+    normalized = normalize_text(text)
+    IO_STATS["text_cache_bytes_written"] += text_cache.put_text(digest, normalized)
+    results = match_keywords(normalized, keywords, template) if text else {}
+    if template == KEYWORD_PATTERN:
+        text_cache.mark_scanned(digest, keywords)
+    return digest, text, results
+
+
+def record_report(digest, text, results, assigned_to, filename):
+    """
+    Links a parsed report to its user, runs the anomaly checks and adds its values to the
+    population sketches. Returns the history entry.
+    """
+    filename = blob_store.add_reference(assigned_to, filename, digest)
+    entry = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "filename": filename,
+        "assigned_to": assigned_to,
+        "report_date": extract_date_from_text(text) if text else "Unknown",
+        "sha256": digest,
+        "results": results
+    }
+    entry["flags"] = get_engine().update(assigned_to, results, entry["timestamp"], filename)
+    get_population().update(assigned_to, results)
+    return entry
+
+
+def ingest_report(path, assigned_to, keywords, filename=None, template=KEYWORD_PATTERN):
+    """
+    Returns (report_entry, text); the caller decides where the entry is saved.
+    """
+    digest, text, results = parse_report(path, keywords, template)
+    entry = record_report(digest, text, results, assigned_to, filename or os.path.basename(path))
+    return entry, text
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python ingest.py <report.pdf> [...] <username>")
+        sys.exit(1)
+    with open("keywords.txt", "r") as f:
+        keyword_list = [line.strip() for line in f if line.strip()]
+    for pdf_path in sys.argv[1:-1]:
+        report, _ = ingest_report(pdf_path, sys.argv[-1], keyword_list)
+        print(f"✅ {pdf_path}: {len(report['results'])} parameters extracted")
+    for stage, count in IO_STATS.items():
+        print(f"• {stage}: {count}")
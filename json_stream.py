@@ -0,0 +1,92 @@
+import json
+
+READ_SIZE = 64 * 1024
+WHITESPACE = " \t\r\n"
+
+
+class _Reader:
+    def __init__(self, f, read_size):
+        self.f = f
+        self.read_size = read_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size=None):
+        if self.eof:
+            return False
+        chunk = self.f.read(size or self.read_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos}")
+        self.pos += 1
+
+    def value(self, decoder=json.JSONDecoder()):
+        self.peek()
+        size = self.read_size
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buf, self.pos)
+                # a value touching the end of the buffer may continue in the next read
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            size *= 2
+            self.fill(size)
+
+
+def _iter_items(reader):
+    reader.expect("[")
+    if reader.peek() == "]":
+        reader.pos += 1
+        return
+    while True:
+        yield reader.value()
+        sep = reader.peek()
+        reader.pos += 1
+        if sep == "]":
+            return
+        if sep != ",":
+            raise ValueError(f"Expected ',' or ']' at offset {reader.pos - 1}")
+
+
+def iter_array(path, key=None, read_size=READ_SIZE):
+    """
+    Yields the elements of a JSON array one at a time without loading the whole file.
+    With key, the array is read from that member of a top-level object (e.g. a FHIR bundle's "entry").
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        reader = _Reader(f, read_size)
+        if key is None:
+            yield from _iter_items(reader)
+            return
+
+        reader.expect("{")
+        while reader.peek() not in ("}", ""):
+            name = reader.value()
+            reader.expect(":")
+            if name == key:
+                yield from _iter_items(reader)
+                return
+            reader.value()
+            if reader.peek() == ",":
+                reader.pos += 1
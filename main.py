@@ -1,26 +1,14 @@
 import tkinter as tk
 from tkinter import messagebox
 from tkinter import ttk
-import csv
-import os
+from user_directory import get_directory
 
 
 def load_users():
-    users = {}
     try:
-        if not os.path.exists("users.csv"):
-            raise FileNotFoundError
-
-        with open("users.csv", "r") as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                if not all(key in row for key in ["username", "password", "role"]):
-                    raise ValueError("Invalid users.csv format")
-                users[row["username"]] = {
-                    "password": row["password"],
-                    "role": row["role"]
-                }
-        return users
+        directory = get_directory()
+        directory.refresh()
+        return directory.users
     except FileNotFoundError:
         messagebox.showerror("Critical Error", "users.csv not found!")
         return {}
@@ -37,6 +25,8 @@ def login():
         messagebox.showwarning("Validation", "Username and password are required")
         return
 
+    # cheap stat check; only re-parses users.csv if it was edited since startup
+    users = load_users()
     if username in users and users[username]["password"] == password:
         role = users[username]["role"]
         messagebox.showinfo("Success", f"Welcome {username} ({role})")
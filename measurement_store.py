@@ -0,0 +1,239 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from bisect import bisect_left
+from datetime import datetime, timedelta
+import report_store
+
+STORE_FILE = "report_history.bin"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# File layout (little endian, every column 8-byte aligned):
+#   header | tables json | user row offsets u64[n_users + 1] | timestamps i64[n_rows]
+#   | user ids u32[n_rows] | presence bitmap u8[n_rows * bitmap_width] | values f64[n_rows * n_params]
+MAGIC = b"HAMS"
+VERSION = 2    # 1 stored values as f32, which rounded anything past ~7 significant digits
+HEADER = struct.Struct("<4sHHQII")
+EPOCH = datetime(1970, 1, 1)
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def to_epoch(timestamp):
+    return int((datetime.strptime(timestamp, TIMESTAMP_FORMAT) - EPOCH).total_seconds())
+
+
+def from_epoch(seconds):
+    return EPOCH + timedelta(seconds=seconds)
+
+
+def build_store(reports, keywords=None, path=STORE_FILE):
+    """
+    Writes the reports as a compact columnar file that MeasurementStore can memory-map.
+    Parameter names and users are interned once; rows are grouped by user and sorted by time.
+    """
+    params = list(keywords or [])
+    param_ids = {name: i for i, name in enumerate(params)}
+    rows = []
+    for report in reports:
+        if "results" not in report:
+            continue
+        for name in report["results"]:
+            if name not in param_ids:
+                param_ids[name] = len(params)
+                params.append(name)
+        rows.append((report.get("assigned_to", "N/A"), to_epoch(report["timestamp"]), report["results"]))
+
+    rows.sort(key=lambda row: (row[0], row[1]))
+    users = sorted({row[0] for row in rows})
+    user_ids = {name: i for i, name in enumerate(users)}
+
+    n_rows, n_params = len(rows), len(params)
+    bitmap_width = (n_params + 7) // 8
+    offsets = [0] * (len(users) + 1)
+    timestamps = bytearray(8 * n_rows)
+    owners = bytearray(4 * n_rows)
+    bitmap = bytearray(n_rows * bitmap_width)
+    values = bytearray(8 * n_rows * n_params)
+
+    for row, (user, epoch, results) in enumerate(rows):
+        uid = user_ids[user]
+        offsets[uid + 1] = row + 1
+        struct.pack_into("<q", timestamps, 8 * row, epoch)
+        struct.pack_into("<I", owners, 4 * row, uid)
+        for name, value in results.items():
+            if not isinstance(value, (int, float)):
+                continue
+            pid = param_ids[name]
+            bitmap[row * bitmap_width + pid // 8] |= 1 << (pid % 8)
+            struct.pack_into("<d", values, 8 * (row * n_params + pid), value)
+
+    tables = json.dumps({"params": params, "users": users}).encode("utf-8")
+    sections = [struct.pack(f"<{len(offsets)}Q", *offsets), timestamps, owners, bitmap, values]
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, bitmap_width, n_rows, n_params, len(users)))
+        f.write(struct.pack("<I", len(tables)))
+        f.write(tables)
+        for section in sections:
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+            f.write(section)
+    os.replace(tmp_path, path)
+
+
+def rebuild_from_history(history_path, path, keywords=None):
+    reports = []
+    if os.path.exists(history_path):
+        with open(history_path, "r") as f:
+            content = f.read()
+            reports = json.loads(content) if content else []
+    build_store(reports, keywords, path)
+
+
+def _ensure(path, sources, rebuild):
+    """
+    Rebuilds the binary store when it is missing, older than any of its sources or written
+    in an older layout, then opens it.
+    """
+    if not os.path.exists(path) or any(
+            os.path.exists(source) and os.path.getmtime(source) > os.path.getmtime(path) for source in sources):
+        rebuild()
+    try:
+        return MeasurementStore(path)
+    except ValueError:
+        rebuild()
+        return MeasurementStore(path)
+
+
+def ensure_store(history_path, path):
+    return _ensure(path, [history_path], lambda: rebuild_from_history(history_path, path))
+
+
+def ensure_user_store(user):
+    """
+    Opens the store built from one user's history shard and append log; other users' data is never read.
+    """
+    report_store.ensure_migrated()
+    path = report_store.store_path(user)
+    return _ensure(path, [report_store.shard_path(user), report_store.log_path(user)],
+                   lambda: build_store(report_store.load_user_reports(user), path=path))
+
+
+def rebuild_all(path=STORE_FILE):
+    build_store(report_store.load_all_reports(), path=path)
+    return MeasurementStore(path)
+
+
+class MeasurementStore:
+    """
+    Read-only, memory-mapped view over a file written by build_store.
+    Only the pages that are actually touched are loaded into memory.
+    """
+
+    def __init__(self, path=STORE_FILE):
+        self._file = open(path, "rb")
+        self._mm = None
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            with memoryview(self._mm) as buf:
+                self._parse(buf)
+        except (ValueError, KeyError, TypeError, struct.error) as e:
+            # truncated or half-written files included, so callers rebuild instead of crashing
+            self.close()
+            raise ValueError(f"{path} is not a measurement store ({e})") from None
+
+    def _parse(self, buf):
+        magic, version, self.bitmap_width, self.n_rows, self.n_params, n_users = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("unknown layout")
+        offset = HEADER.size
+        (tables_len,) = struct.unpack_from("<I", buf, offset)
+        offset += 4
+        tables = json.loads(bytes(buf[offset:offset + tables_len]))
+        offset += tables_len
+
+        self.params = tables["params"]
+        self.users = tables["users"]
+        self._param_ids = {name: i for i, name in enumerate(self.params)}
+
+        def column(fmt, count, width):
+            nonlocal offset
+            offset = _align(offset)
+            if offset + count * width > len(buf):
+                raise ValueError("file is truncated")
+            view = buf[offset:offset + count * width].cast(fmt) if fmt else buf[offset:offset + count * width]
+            offset += count * width
+            return view
+
+        self._offsets = column("Q", n_users + 1, 8)
+        self._timestamps = column("q", self.n_rows, 8)
+        self._owners = column("I", self.n_rows, 4)
+        self._bitmap = column(None, self.n_rows * self.bitmap_width, 1)
+        self._values = column("d", self.n_rows * self.n_params, 8)
+
+    def close(self):
+        for name in ("_offsets", "_timestamps", "_owners", "_bitmap", "_values"):
+            view = self.__dict__.pop(name, None)
+            if view is not None:
+                view.release()
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                pass
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.n_rows
+
+    def user_rows(self, user):
+        i = bisect_left(self.users, user)
+        if i == len(self.users) or self.users[i] != user:
+            return range(0)
+        return range(self._offsets[i], self._offsets[i + 1])
+
+    def user(self, row):
+        return self.users[self._owners[row]]
+
+    def timestamp(self, row):
+        return from_epoch(self._timestamps[row])
+
+    def value(self, row, param):
+        pid = self._param_ids.get(param)
+        if pid is None or not self._bitmap[row * self.bitmap_width + pid // 8] & (1 << (pid % 8)):
+            return None
+        return self._values[row * self.n_params + pid]
+
+    def results(self, row):
+        return {param: v for param in self.params if (v := self.value(row, param)) is not None}
+
+    def series(self, user, param):
+        dates, values = [], []
+        for row in self.user_rows(user):
+            value = self.value(row, param)
+            if value is not None:
+                dates.append(self.timestamp(row))
+                values.append(value)
+        return dates, values
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        rebuild_from_history(sys.argv[1], STORE_FILE)
+    else:
+        build_store(report_store.load_all_reports())
+    with MeasurementStore() as store:
+        print(f"✅ {len(store)} reports, {len(store.params)} parameters, {len(store.users)} users -> "
+              f"{STORE_FILE} ({os.path.getsize(STORE_FILE)} bytes)")
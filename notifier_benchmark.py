@@ -0,0 +1,96 @@
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+import reminder_emailer
+import telegram_notifier
+from fake_telegram import start_fake_server
+
+
+def make_reminders(count, chats):
+    today = datetime.now().strftime("%Y-%m-%d")
+    return [
+        {"type": "Test", "title": f"Benchmark reminder {i}", "date": today, "chat_id": f"chat-{i % chats}"}
+        for i in range(count)
+    ]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))] if ordered else 0.0
+
+
+def run(count, chats, latency, jitter, error_rate, rate_limit_rate, pacing=True):
+    """
+    Runs check_and_notify end to end against the fake API inside a scratch directory.
+    """
+    server, url = start_fake_server(latency=latency, jitter=jitter, error_rate=error_rate,
+                                    rate_limit_rate=rate_limit_rate, retry_after=0, seed=1)
+    telegram_notifier.API_URL = url
+    telegram_notifier.BOT_TOKEN = "benchmark"
+    if not pacing:
+        telegram_notifier.MIN_INTERVAL_PER_CHAT = 0
+        telegram_notifier.MIN_INTERVAL_GLOBAL = 0
+    for key in telegram_notifier.SEND_STATS:
+        telegram_notifier.SEND_STATS[key] = 0
+    telegram_notifier.SEND_LATENCIES.clear()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            with open(reminder_emailer.REMINDER_FILE, "w") as f:
+                json.dump(make_reminders(count, chats), f)
+            start = time.perf_counter()
+            sent, delivered, retries = reminder_emailer.check_and_notify()
+            elapsed = time.perf_counter() - start
+            # a second run must find everything delivered and send nothing
+            again = reminder_emailer.check_and_notify()
+        finally:
+            os.chdir(cwd)
+            server.shutdown()
+
+    latencies = [s * 1000 for s in telegram_notifier.SEND_LATENCIES]
+    return {
+        "reminders": count,
+        "chats": chats,
+        "elapsed_s": elapsed,
+        "messages": sent,
+        "delivered": delivered,
+        "retries": retries,
+        "requests": telegram_notifier.SEND_STATS["requests"],
+        "notifications_per_s": delivered / elapsed if elapsed else 0.0,
+        "messages_per_s": sent / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "mean_ms": statistics.fmean(latencies) if latencies else 0.0,
+        "resent_on_rerun": again[1],
+        "fake_server": dict(server.state.counts),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure reminder notification throughput against fake_telegram.py.")
+    parser.add_argument("--reminders", type=int, default=10000)
+    parser.add_argument("--chats", type=int, default=1000, help="distinct recipients the reminders are spread over")
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--no-pacing", action="store_true",
+                        help="disable the per-chat/global send intervals to measure raw notifier overhead")
+    args = parser.parse_args()
+
+    result = run(args.reminders, args.chats, args.latency_ms / 1000, args.jitter_ms / 1000,
+                 args.error_rate, args.rate_limit_rate, pacing=not args.no_pacing)
+    print(f"📨 {result['delivered']}/{result['reminders']} reminders to {result['chats']} chats in "
+          f"{result['messages']} messages ({result['requests']} requests, {result['retries']} retries) "
+          f"in {result['elapsed_s']:.2f}s")
+    print(f"⚡ {result['notifications_per_s']:.1f} notifications/s, {result['messages_per_s']:.1f} messages/s")
+    print(f"⏱️ send latency p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, "
+          f"p99 {result['p99_ms']:.1f} ms")
+    print(f"🔁 re-run resent {result['resent_on_rerun']} notifications; fake server saw {result['fake_server']}")
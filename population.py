@@ -0,0 +1,249 @@
+import argparse
+import random
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+from file_utils import load_json, save_json, file_lock
+
+STATE_FILE = "population_sketches.json"
+SKETCH_K = 200           # accuracy knob: rank error is roughly 1.7 / SKETCH_K
+SHRINK = 2 / 3           # each lower compactor level holds 2/3 of the one above it
+ALL = "all"              # cohort key covering every patient
+BANDS = (5, 25, 50, 75, 95)
+
+_random = random.Random()
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch: a stack of compactors where an item on level h stands for 2**h readings.
+    Memory stays around 3 * k values no matter how many readings are added, and two sketches
+    merge by concatenating their levels, so shards can be summarised separately and combined.
+    """
+
+    def __init__(self, k=SKETCH_K):
+        self.k = k
+        self.n = 0
+        self.levels = [[]]
+        self._cdf = None
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(self.k * SHRINK ** depth))
+
+    def _size(self):
+        return sum(len(level) for level in self.levels)
+
+    def _compress(self):
+        while self._size() > sum(self._capacity(h) for h in range(len(self.levels))):
+            for h, level in enumerate(self.levels):
+                if len(level) < self._capacity(h):
+                    continue
+                if h + 1 == len(self.levels):
+                    self.levels.append([])
+                level.sort()
+                # an odd item out stays behind so no weight is lost
+                leftover = level[-1:] if len(level) % 2 else []
+                paired = level[:len(level) - len(leftover)]
+                self.levels[h + 1].extend(paired[_random.getrandbits(1)::2])
+                self.levels[h] = leftover
+                break
+
+    def update(self, value):
+        self.levels[0].append(float(value))
+        self.n += 1
+        self._cdf = None
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for h, level in enumerate(other.levels):
+            self.levels[h].extend(level)
+        self.n += other.n
+        self._cdf = None
+        self._compress()
+        return self
+
+    def _sorted(self):
+        if self._cdf is None:
+            items = sorted((value, 1 << h) for h, level in enumerate(self.levels) for value in level)
+            self._cdf = ([value for value, _ in items], list(accumulate(weight for _, weight in items)))
+        return self._cdf
+
+    def quantile(self, q):
+        """
+        Value below which a fraction q (0..1) of the readings fall.
+        """
+        values, cumulative = self._sorted()
+        if not values:
+            return None
+        i = bisect_left(cumulative, q * cumulative[-1])
+        return values[min(i, len(values) - 1)]
+
+    def rank(self, value):
+        """
+        Percentile rank (0..100) of value; ties count half, so the median reading ranks 50.
+        """
+        values, cumulative = self._sorted()
+        if not values:
+            return None
+        lo, hi = bisect_left(values, value), bisect_right(values, value)
+        below = cumulative[lo - 1] if lo else 0
+        at_or_below = cumulative[hi - 1] if hi else 0
+        return 50.0 * (below + at_or_below) / cumulative[-1]
+
+    def to_dict(self):
+        return {"k": self.k, "n": self.n, "levels": self.levels}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data.get("k", SKETCH_K))
+        sketch.n = data["n"]
+        sketch.levels = data["levels"] or [[]]
+        return sketch
+
+
+def _cohort_of(user):
+    from user_directory import get_directory
+    try:
+        info = get_directory().get(user)
+    except (FileNotFoundError, ValueError):
+        return None
+    return info.get("cohort") if info else None
+
+
+def _merge_into(target, cohort, sketches):
+    params = target.setdefault(cohort, {})
+    for param, sketch in sketches.items():
+        params.setdefault(param, KLLSketch(sketch.k)).merge(sketch)
+
+
+def _shard_sketches(user):
+    """
+    Summarises one user's history shard; runs in a worker process during backfill.
+    """
+    import report_store
+    sketches = {}
+    for report in report_store.iter_user_reports(user):
+        for param, value in report.get("results", {}).items():
+            if isinstance(value, (int, float)):
+                sketches.setdefault(param, KLLSketch()).update(value)
+    return user, {param: sketch.to_dict() for param, sketch in sketches.items()}
+
+
+class PopulationStats:
+    """
+    One sketch per parameter for the whole population and for each cohort (the optional
+    "cohort" column in users.csv). Bands and percentile ranks cost the same however many
+    reports have been ingested.
+    New values are also collected in small delta sketches; save() merges those into the file's
+    current sketches under a lock, so processes updating side by side never drop each other's values.
+    """
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.sketches = self._read()
+        self._pending = {}
+
+    def _read(self):
+        return {
+            cohort: {param: KLLSketch.from_dict(data) for param, data in params.items()}
+            for cohort, params in load_json(self.path, {}).items()
+        }
+
+    def _write(self, sketches):
+        save_json(self.path, {
+            cohort: {param: sketch.to_dict() for param, sketch in params.items()}
+            for cohort, params in sketches.items()
+        }, indent=None)
+
+    def save(self):
+        with file_lock(self.path):
+            sketches = self._read()
+            for cohort, params in self._pending.items():
+                _merge_into(sketches, cohort, params)
+            self._write(sketches)
+        self.sketches, self._pending = sketches, {}
+
+    def _cohorts_for(self, user):
+        cohort = _cohort_of(user)
+        return [ALL, cohort] if cohort and cohort != ALL else [ALL]
+
+    def update(self, user, results, save=True):
+        for cohort in self._cohorts_for(user):
+            for target in (self.sketches, self._pending):
+                params = target.setdefault(cohort, {})
+                for param, value in results.items():
+                    if isinstance(value, (int, float)):
+                        params.setdefault(param, KLLSketch()).update(value)
+        if save:
+            self.save()
+
+    def merge_sketches(self, cohort, sketches):
+        _merge_into(self.sketches, cohort, sketches)
+
+    def cohorts(self):
+        return sorted(self.sketches, key=lambda c: (c != ALL, c))
+
+    def params(self, cohort=ALL):
+        return sorted(self.sketches.get(cohort, {}))
+
+    def count(self, param, cohort=ALL):
+        sketch = self.sketches.get(cohort, {}).get(param)
+        return sketch.n if sketch else 0
+
+    def bands(self, param, cohort=ALL, percentiles=BANDS):
+        sketch = self.sketches.get(cohort, {}).get(param)
+        if not sketch:
+            return {}
+        return {p: sketch.quantile(p / 100) for p in percentiles}
+
+    def rank(self, param, value, cohort=ALL):
+        sketch = self.sketches.get(cohort, {}).get(param)
+        return sketch.rank(value) if sketch else None
+
+    def backfill(self, workers=None):
+        """
+        Rebuilds every sketch from the history shards: each shard is summarised in parallel,
+        then the per-shard sketches are merged into the population and cohort totals.
+        """
+        import report_store
+        self.sketches = {}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for user, shard in pool.map(_shard_sketches, report_store.users()):
+                sketches = {param: KLLSketch.from_dict(data) for param, data in shard.items()}
+                for cohort in self._cohorts_for(user):
+                    self.merge_sketches(cohort, sketches)
+        # a rebuild replaces the file rather than merging into it
+        with file_lock(self.path):
+            self._write(self.sketches)
+        self._pending = {}
+
+
+_population = None
+
+
+def get_population():
+    global _population
+    if _population is None:
+        _population = PopulationStats()
+    return _population
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Population percentile bands per parameter.")
+    parser.add_argument("command", nargs="?", choices=["show", "backfill"], default="show")
+    parser.add_argument("--cohort", default=ALL)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    population = get_population()
+    if args.command == "backfill":
+        population.backfill(args.workers)
+        print(f"✅ Rebuilt sketches for {len(population.params())} parameters "
+              f"across {len(population.cohorts())} cohort(s).")
+    for name in population.params(args.cohort):
+        band = population.bands(name, args.cohort)
+        print(f"{name:<30} n={population.count(name, args.cohort):<6} " +
+              "  ".join(f"p{p}={v:.4g}" for p, v in band.items()))
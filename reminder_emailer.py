@@ -1,7 +1,7 @@
 import json
 import os
 from datetime import datetime, timedelta
-from telegram_notifier import send_telegram_message
+from telegram_notifier import enqueue_messages, drain_outbox, CHAT_ID
 
 REMINDER_FILE = "reminders.json"
 LOG_FILE = "reminder_log.txt"
@@ -25,9 +25,9 @@ def check_and_notify():
 
     if not reminders:
         log("ℹ️ No reminders found.")
-        return
+        return 0, 0, 0
 
-    sent_any = False
+    due = []
     for reminder in reminders:
         try:
             r_date = datetime.strptime(reminder["date"], "%Y-%m-%d").date()
@@ -42,14 +42,23 @@ def check_and_notify():
                     f"• Date: {reminder['date']} ({timing})\n\n"
                     f"🩺 Stay healthy!"
                 )
-                send_telegram_message(message)
-                log(f"✅ Reminder sent for '{reminder['title']}' scheduled {timing}.")
-                sent_any = True
+                # duplicated entries in reminders.json share a key, so they are only sent once
+                dedupe_key = f"{reminder['type']}|{reminder['title']}|{reminder['date']}|{timing}"
+                due.append((message, reminder.get("chat_id", CHAT_ID), dedupe_key))
         except Exception as e:
             log(f"⚠️ Skipped invalid reminder: {reminder} | Error: {e}")
 
-    if not sent_any:
-        log("📭 No reminders to send today or tomorrow.")
+    queued = enqueue_messages(due)
+    if queued:
+        log(f"✅ Queued {queued} reminder(s) for today or tomorrow.")
+    else:
+        log("📭 No new reminders to queue for today or tomorrow.")
+
+    # the day's reminders were queued together, so there is nothing to wait for;
+    # this also retries anything a previous run could not deliver
+    sent, delivered, retries = drain_outbox(window=0)
+    log(f"📨 Delivered {delivered} notification(s) in {sent} message(s), {retries} rate-limit retries.")
+    return sent, delivered, retries
 
 if __name__ == "__main__":
     check_and_notify()
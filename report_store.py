@@ -0,0 +1,183 @@
+import json
+import os
+from itertools import islice
+import change_events
+from json_stream import iter_array
+from file_utils import load_json, save_json, file_lock
+
+LEGACY_HISTORY_FILE = "report_history.json"
+HISTORY_DIR = "report_history"
+MANIFEST_FILE = os.path.join(HISTORY_DIR, "manifest.json")
+COMPACT_MIN_BYTES = 4 * 1024 * 1024    # appended reports are folded into the shard past this and the shard's size
+
+
+def shard_path(user):
+    if not user or os.sep in user or (os.altsep and os.altsep in user) or user.startswith("."):
+        raise ValueError(f"Invalid user name for a history shard: {user!r}")
+    return os.path.join(HISTORY_DIR, f"{user}.json")
+
+
+def log_path(user):
+    """
+    Reports appended since the shard was last rewritten, one JSON object per line.
+    """
+    return os.path.splitext(shard_path(user))[0] + ".jsonl"
+
+
+def store_path(user):
+    return os.path.join(HISTORY_DIR, f"{user}.bin")
+
+
+def load_manifest():
+    ensure_migrated()
+    return load_json(MANIFEST_FILE, {"users": {}})
+
+
+def _summarize(reports):
+    return {
+        "count": len(reports),
+        "last_timestamp": max((r["timestamp"] for r in reports), default=None)
+    }
+
+
+def ensure_migrated():
+    """
+    Splits the old single report_history.json into per-user shards the first time it is needed.
+    The legacy file is left in place; the manifest marks the migration as done.
+    """
+    if os.path.exists(MANIFEST_FILE):
+        return
+    shards = {}
+    for report in load_json(LEGACY_HISTORY_FILE, []):
+        shards.setdefault(report.get("assigned_to", "N/A"), []).append(report)
+    for user, reports in shards.items():
+        save_json(shard_path(user), reports)
+    save_json(MANIFEST_FILE, {"users": {user: _summarize(reports) for user, reports in shards.items()}})
+
+
+def users():
+    return sorted(load_manifest()["users"])
+
+
+def _iter_log(user):
+    try:
+        f = open(log_path(user), "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # cut short by a crash; the next append drops it
+            yield json.loads(line)
+
+
+def load_user_reports(user):
+    ensure_migrated()
+    return load_json(shard_path(user), []) + list(_iter_log(user))
+
+
+def iter_user_reports(user):
+    ensure_migrated()
+    path = shard_path(user)
+    if os.path.exists(path):
+        yield from iter_array(path)
+    yield from _iter_log(user)
+
+
+def read_user_reports(user, start, count):
+    """
+    The reports an "added" event points at: count entries from index start of the user's shard.
+    """
+    return list(islice(iter_user_reports(user), start, start + count))
+
+
+def load_all_reports():
+    """
+    Cross-user view for the admin dashboard, in upload order.
+    """
+    reports = []
+    for user in users():
+        reports.extend(load_user_reports(user))
+    reports.sort(key=lambda r: r["timestamp"])
+    return reports
+
+
+def _write_shard(user, reports):
+    # callers hold the history lock; the rewritten shard absorbs the append log
+    save_json(shard_path(user), reports, indent=None)
+    if os.path.exists(log_path(user)):
+        os.remove(log_path(user))
+
+
+def _append_log(user, reports):
+    data = "".join(json.dumps(report) + "\n" for report in reports).encode("utf-8")
+    with open(log_path(user), "a+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size:
+            f.seek(size - 1)
+            if f.read(1) != b"\n":
+                f.seek(0)
+                f.truncate(f.read().rfind(b"\n") + 1)
+        f.write(data)
+    return size + len(data)
+
+
+def _save_shard(user, reports):
+    _write_shard(user, reports)
+    manifest = load_manifest()
+    manifest["users"][user] = _summarize(reports)
+    save_json(MANIFEST_FILE, manifest)
+
+
+def save_user_reports(user, reports):
+    with file_lock(MANIFEST_FILE):
+        _save_shard(user, reports)
+    change_events.publish("reports", {"action": "updated", "user": user})
+
+
+def update_user_reports(user, apply):
+    """
+    Re-reads the user's shard under the history lock and passes it to apply(), which edits it
+    in place and returns whether anything changed; the shard is saved only if it did.
+    Reports appended meanwhile by other processes are kept.
+    """
+    with file_lock(MANIFEST_FILE):
+        reports = load_user_reports(user)
+        changed = apply(reports)
+        if changed:
+            _save_shard(user, reports)
+    if changed:
+        change_events.publish("reports", {"action": "updated", "user": user})
+    return changed
+
+
+def append_reports(entries):
+    """
+    Adds entries to the append logs of the users they belong to, so the cost is that of the new
+    entries alone; a log is folded into its shard once it outgrows it, keeping rewrites amortised.
+    Publishes one "added" event per user naming the new positions so open views can read just those rows.
+    """
+    by_user = {}
+    for entry in entries:
+        by_user.setdefault(entry["assigned_to"], []).append(entry)
+    events = []
+    with file_lock(MANIFEST_FILE):
+        manifest = load_manifest()
+        for user, new_reports in by_user.items():
+            summary = manifest["users"].get(user) or _summarize(load_user_reports(user))
+            events.append({"action": "added", "user": user, "start": summary["count"], "count": len(new_reports)})
+            log_size = _append_log(user, new_reports)
+            shard = shard_path(user)
+            if log_size > max(COMPACT_MIN_BYTES, os.path.getsize(shard) if os.path.exists(shard) else 0):
+                _write_shard(user, load_user_reports(user))
+            manifest["users"][user] = {
+                "count": summary["count"] + len(new_reports),
+                "last_timestamp": max(filter(None, [summary["last_timestamp"]] + [r["timestamp"] for r in new_reports]),
+                                      default=None)
+            }
+        save_json(MANIFEST_FILE, manifest)
+    change_events.publish_many("reports", events)
+
+
+def append_report(entry):
+    append_reports([entry])
@@ -0,0 +1,109 @@
+import json
+import os
+import secrets
+import sys
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+# Set HEALTH_SERVICE_URL (e.g. http://127.0.0.1:8765) to make the dashboards talk to health_service.py
+SERVICE_URL = os.environ.get("HEALTH_SERVICE_URL", "").rstrip("/")
+TIMEOUT = 30
+TOKEN_FILE = "health_service.token"
+
+
+class ServiceError(Exception):
+    pass
+
+
+def enabled():
+    return bool(SERVICE_URL)
+
+
+def service_token(create=False):
+    """
+    The shared secret every request carries: HEALTH_SERVICE_TOKEN if set, otherwise the token
+    file the service writes (readable by this OS user only) the first time it starts.
+    """
+    token = os.environ.get("HEALTH_SERVICE_TOKEN", "")
+    if token:
+        return token
+    try:
+        with open(TOKEN_FILE, "r") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        if not create:
+            return ""
+    token = secrets.token_urlsafe(32)
+    with os.fdopen(os.open(TOKEN_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "w") as f:
+        f.write(token)
+    return token
+
+
+def report_key(report):
+    return [report.get("assigned_to", "N/A"), report["timestamp"], report["filename"]]
+
+
+def call(method, path, payload=None, **params):
+    query = urlencode({k: v for k, v in params.items() if v is not None})
+    url = f"{SERVICE_URL}{path}" + (f"?{query}" if query else "")
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    request = Request(url, data=data, method=method, headers={"Content-Type": "application/json",
+                                                              "Authorization": f"Bearer {service_token()}"})
+    try:
+        with urlopen(request, timeout=TIMEOUT) as response:
+            return json.loads(response.read())
+    except HTTPError as e:
+        try:
+            message = json.loads(e.read()).get("error", e.reason)
+        except ValueError:
+            message = e.reason
+        raise ServiceError(f"{e.code}: {message}") from e
+    except URLError as e:
+        raise ServiceError(f"Health service unreachable at {SERVICE_URL}: {e.reason}") from e
+
+
+def ingest(path, user, filename=None, basic=False):
+    return call("POST", "/ingest", {"path": os.path.abspath(path), "user": user,
+                                    "filename": filename, "basic": basic})
+
+
+def import_export(path, default_user=None):
+    return call("POST", "/import", {"path": os.path.abspath(path), "default_user": default_user})
+
+
+def reports(user=None):
+    return call("GET", "/reports", user=user)
+
+
+def trends(user, params=None):
+    return call("GET", "/trends", user=user, params=",".join(params) if params else None)
+
+
+def summary(user, params=None):
+    return call("GET", "/summary", user=user, params=",".join(params) if params else None)
+
+
+def compare(first, second):
+    """
+    Compares two reports named by their (user, timestamp, filename), which stay stable
+    however either side orders its history.
+    """
+    return call("GET", "/compare", a=json.dumps(report_key(first)), b=json.dumps(report_key(second)))
+
+
+def reminders():
+    return call("GET", "/reminders")
+
+
+def add_reminder(reminder):
+    return call("POST", "/reminders", reminder)
+
+
+if __name__ == "__main__":
+    commands = {"reports": reports, "trends": trends, "summary": summary, "reminders": reminders}
+    if not enabled() or len(sys.argv) < 2 or sys.argv[1] not in commands:
+        print("Usage: HEALTH_SERVICE_URL=http://127.0.0.1:8765 python service_client.py "
+              "[reports|trends|summary|reminders] [user]")
+        sys.exit(1)
+    print(json.dumps(commands[sys.argv[1]](*sys.argv[2:3]), indent=4))
@@ -0,0 +1,67 @@
+import argparse
+import asyncio
+import time
+from urllib.parse import urlsplit
+from service_client import service_token
+
+DEFAULT_PATHS = ["/trends?user=Girish", "/summary?user=Admin", "/reports?user=Girish", "/reminders"]
+
+
+async def client(host, port, paths, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    token = service_token()
+    i = 0
+    try:
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n"
+                         f"Authorization: Bearer {token}\r\n\r\n".encode("latin-1"))
+            await writer.drain()
+            status = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if b" 200 " not in status:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+async def run(url, clients, duration, paths):
+    parts = urlsplit(url)
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(client(parts.hostname, parts.port or 80, paths, deadline, latencies, errors)
+                           for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"📊 {clients} clients, {elapsed:.1f}s, {len(latencies)} requests, {len(errors)} errors")
+    print(f"• throughput: {len(latencies) / elapsed:.0f} req/s")
+    for pct in (50, 90, 99, 99.9):
+        print(f"• p{pct:g}: {percentile(latencies, pct) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test a running health_service.py")
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--path", action="append", help="request path (repeatable)")
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.clients, args.duration, args.path or DEFAULT_PATHS))
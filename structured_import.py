@@ -0,0 +1,415 @@
+import argparse
+import csv
+import os
+import re
+from datetime import datetime
+import report_store
+from anomaly import get_engine
+from json_stream import iter_array
+from population import get_population
+
+KEYWORDS_FILE = "keywords.txt"
+BATCH_SIZE = 5000        # reports written to the history shards per append
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# LOINC codes for the parameters in keywords.txt
+LOINC_CODES = {
+    "718-7": "Hemoglobin",
+    "6690-2": "WBC",
+    "777-3": "Platelet count",
+    "789-8": "RBC",
+    "4544-3": "PCV",
+    "787-2": "MCV",
+    "785-6": "MCH",
+    "786-4": "MCHC",
+    "788-0": "RDW",
+    "32623-1": "MPV",
+    "770-8": "Neutrophils",
+    "751-8": "Absolute Neutrophils",
+    "713-8": "Eosinophils",
+    "711-2": "Absolute Eosinophils",
+    "706-2": "Basophils",
+    "704-7": "Absolute Basophils",
+    "736-9": "Lymphocytes",
+    "731-0": "Absolute Lymphocytes",
+    "5905-5": "Monocytes",
+    "742-7": "Absolute Monocytes",
+    "1975-2": "Bilirubin-Total",
+    "1968-7": "Bilirubin-Conjugated",
+    "1971-1": "Bilirubin-Unconjugated",
+    "1920-8": "AST",
+    "1742-6": "ALT",
+    "6768-6": "Alkaline Phosphatase",
+    "2885-2": "Protein",
+    "1751-7": "Albumin",
+    "10834-0": "Globulin",
+    "2324-2": "GGT",
+    "1558-6": "Fasting Glucose",
+    "1521-4": "Post Prandial Glucose",
+    "2160-0": "Creatinine",
+    "2951-2": "Sodium",
+    "2823-3": "Potassium",
+    "2075-0": "Chloride",
+    "5902-2": "Prothrombin Time",
+    "6301-6": "INR",
+    "2093-3": "Total Cholesterol",
+    "2571-8": "Triglycerides",
+    "2085-9": "HDL",
+    "13457-7": "LDL",
+    "2089-1": "LDL",
+    "13458-5": "VLDL",
+    "43396-1": "Non HDL",
+    "9830-1": "Cholesterol HDL Ratio",
+    "11054-4": "LDL HDL Ratio",
+    "4548-4": "HbA1C",
+    "27353-2": "Estimated Average Glucose",
+    "14957-5": "Microalbumin",
+    "14959-1": "ACR",
+}
+
+# Other names labs use for the same parameters; keyword names themselves always match
+NAME_ALIASES = {
+    "haemoglobin": "Hemoglobin",
+    "leukocytes": "WBC",
+    "white blood cells": "WBC",
+    "platelets": "Platelet count",
+    "hematocrit": "PCV",
+    "haematocrit": "PCV",
+    "bilirubin total": "Bilirubin-Total",
+    "bilirubin direct": "Bilirubin-Conjugated",
+    "bilirubin indirect": "Bilirubin-Unconjugated",
+    "total protein": "Protein",
+    "glucose fasting": "Fasting Glucose",
+    "hba1c": "HbA1C",
+    "glycated hemoglobin": "HbA1C",
+    "hdl cholesterol": "HDL",
+    "ldl cholesterol": "LDL",
+}
+
+CSV_COLUMNS = {
+    "user": ("user", "username", "patient", "patient_id"),
+    "date": ("date", "effective", "collected", "collection_date", "timestamp"),
+    "report": ("report_id", "report", "accession", "order_id"),
+    "code": ("code", "loinc", "loinc_code"),
+    "name": ("name", "test", "parameter", "analyte"),
+    "value": ("value", "result"),
+}
+
+
+def _name_key(name):
+    return re.sub(r"[^a-z0-9]+", " ", name.lower()).strip()
+
+
+class ParameterMap:
+    """
+    Resolves a lab's code or test name to one of our keywords.txt parameters.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = set(keywords)
+        self.names = {_name_key(k): k for k in keywords}
+        for alias, keyword in NAME_ALIASES.items():
+            self.names.setdefault(_name_key(alias), keyword)
+        self.unmapped = {}
+
+    def resolve(self, code=None, name=None):
+        keyword = LOINC_CODES.get(code) if code else None
+        if keyword is None and name:
+            keyword = self.names.get(_name_key(name))
+        if keyword in self.keywords:
+            return keyword
+        label = code or name or "?"
+        self.unmapped[label] = self.unmapped.get(label, 0) + 1
+        return None
+
+
+def _timestamp(value):
+    value = (value or "").strip()
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).strftime(TIMESTAMP_FORMAT)
+    except ValueError:
+        pass
+    for fmt in ("%d-%m-%Y", "%d/%m/%Y", "%d-%m-%Y %H:%M", "%d/%m/%Y %H:%M"):
+        try:
+            return datetime.strptime(value, fmt).strftime(TIMESTAMP_FORMAT)
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date: {value!r}")
+
+
+def _number(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        return float(value.replace(",", ".")) if value.count(",") == 1 else None
+
+
+def _column(fieldnames, role):
+    lowered = {name.strip().lower(): name for name in fieldnames or []}
+    for candidate in CSV_COLUMNS[role]:
+        if candidate in lowered:
+            return lowered[candidate]
+    return None
+
+
+def iter_csv_observations(path, parameter_map, default_user=None, stats=None):
+    """
+    Yields (user, timestamp, report key, parameter, value) from a long-format CSV export
+    (one row per result), reading it a row at a time. Rows with an unreadable date are
+    skipped and counted in stats["bad_dates"].
+    """
+    with open(path, "r", newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        columns = {role: _column(reader.fieldnames, role) for role in CSV_COLUMNS}
+        if not columns["date"] or not columns["value"] or not (columns["code"] or columns["name"]):
+            raise ValueError(f"{path} needs a date, a value and a code or test name column")
+        if not columns["user"] and not default_user:
+            raise ValueError(f"{path} has no user column; choose the user to import it for")
+        for row in reader:
+            param = parameter_map.resolve(row.get(columns["code"]) if columns["code"] else None,
+                                          row.get(columns["name"]) if columns["name"] else None)
+            value = _number(row[columns["value"]]) if param else None
+            if value is None:
+                continue
+            user = (row.get(columns["user"]) if columns["user"] else None) or default_user
+            try:
+                timestamp = _timestamp(row[columns["date"]])
+            except ValueError:
+                _count_bad_date(stats)
+                continue
+            key = row.get(columns["report"]) if columns["report"] else None
+            yield user, timestamp, key or timestamp, param, value
+
+
+def _coding(concept):
+    for coding in (concept or {}).get("coding", []):
+        if coding.get("system", "").endswith("loinc.org") and coding.get("code"):
+            return coding["code"], coding.get("display") or concept.get("text")
+    return None, (concept or {}).get("text")
+
+
+def _count_bad_date(stats):
+    if stats is not None:
+        stats["bad_dates"] += 1
+
+
+def iter_fhir_observations(path, parameter_map, patient_users=None, default_user=None, stats=None):
+    """
+    Yields (user, timestamp, report key, parameter, value) for every Observation in a FHIR
+    Bundle, streaming the "entry" array so the bundle is never held in memory.
+    Each Observation belongs to its own subject; default_user only covers ones without a subject.
+    """
+    patient_users = patient_users or {}
+    for entry in iter_array(path, key="entry"):
+        resource = entry.get("resource", {})
+        if resource.get("resourceType") != "Observation" or resource.get("status") == "entered-in-error":
+            continue
+        subject = resource.get("subject") or {}
+        patient = subject.get("reference", "").rpartition("/")[2]
+        if patient or subject.get("display"):
+            user = patient_users.get(patient) or patient or subject.get("display")
+        else:
+            user = default_user
+        when = resource.get("effectiveDateTime") or resource.get("issued")
+        if not user or not when:
+            continue
+        try:
+            timestamp = _timestamp(when)
+        except ValueError:
+            _count_bad_date(stats)
+            continue
+        based_on = resource.get("basedOn") or [{}]
+        key = based_on[0].get("reference") or timestamp
+        # panels carry their results as components
+        for part in [resource] + resource.get("component", []):
+            quantity = part.get("valueQuantity")
+            if not quantity or "value" not in quantity:
+                continue
+            param = parameter_map.resolve(*_coding(part.get("code")))
+            value = _number(quantity["value"]) if param else None
+            if value is not None:
+                yield user, timestamp, key, param, value
+
+
+def group_reports(observations, source, filename):
+    """
+    Folds consecutive observations of the same user and report into history entries.
+    Only the current report is held in memory; if an export splits a report's rows up,
+    the pieces share an import_id and HistoryImporter merges them.
+    """
+    current, current_id = None, None
+    for user, timestamp, key, param, value in observations:
+        import_id = f"{source}:{user}:{key}"
+        if import_id != current_id:
+            if current:
+                yield current
+            current_id = import_id
+            current = {
+                "timestamp": timestamp,
+                "filename": filename,
+                "assigned_to": user,
+                "report_date": timestamp[:10],
+                "source": source,
+                "import_id": import_id,
+                "results": {}
+            }
+        # the first value wins, as with the first regex match in a PDF
+        current["results"].setdefault(param, value)
+    if current:
+        yield current
+
+
+def _merge_results(results, new_results):
+    """
+    Adds values for parameters results does not have yet. Returns what was added.
+    """
+    added = {param: value for param, value in new_results.items() if param not in results}
+    results.update(added)
+    return added
+
+
+class HistoryImporter:
+    """
+    Appends imported reports in batches, skipping reports a previous import already added,
+    and feeds them through the anomaly checks and population sketches.
+    Pieces of one report that turn up again later in the same file are merged into it.
+    """
+
+    def __init__(self, known_users, batch_size=BATCH_SIZE):
+        self.known_users = known_users
+        self.batch_size = batch_size
+        self.batch = []
+        self.pending = {}      # import_id -> entry in the unwritten batch
+        self.written = set()   # import_ids this import has already appended
+        self.late = {}         # user -> {import_id: results for a report already appended}
+        self.existing = {}     # user -> import_ids stored before this import started
+        self.stats = {"reports": 0, "values": 0, "duplicates": 0, "unknown_user": 0, "bad_dates": 0, "flags": 0}
+
+    def _existing_ids(self, user):
+        # read before any of this user's entries are written, so it never contains this import's own reports
+        if user not in self.existing:
+            self.existing[user] = {r["import_id"] for r in report_store.iter_user_reports(user) if "import_id" in r}
+        return self.existing[user]
+
+    def add(self, entry):
+        user = entry["assigned_to"]
+        if user not in self.known_users:
+            self.stats["unknown_user"] += 1
+            return
+        import_id = entry["import_id"]
+        if import_id in self._existing_ids(user):
+            self.stats["duplicates"] += 1
+            return
+        if import_id in self.pending:
+            _merge_results(self.pending[import_id]["results"], entry["results"])
+            return
+        if import_id in self.written:
+            late = self.late.setdefault(user, {}).setdefault(import_id, {})
+            _merge_results(late, entry["results"])
+            return
+        self.pending[import_id] = entry
+        self.batch.append(entry)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        engine, population = get_engine(), get_population()
+        for entry in self.batch:
+            user = entry["assigned_to"]
+            entry["flags"] = engine.update(user, entry["results"], entry["timestamp"], entry["filename"], save=False)
+            population.update(user, entry["results"], save=False)
+            self.stats["reports"] += 1
+            self.stats["values"] += len(entry["results"])
+            self.stats["flags"] += len(entry["flags"])
+        report_store.append_reports(self.batch)
+        engine.save()
+        population.save()
+        self.written.update(self.pending)
+        self.batch, self.pending = [], {}
+
+    def finish(self):
+        """
+        Writes the last batch, then folds late pieces into the reports they belong to.
+        """
+        self.flush()
+        if not self.late:
+            return
+        engine, population = get_engine(), get_population()
+        for user, pieces in self.late.items():
+            def apply(reports):
+                changed = False
+                for report in reports:
+                    results = pieces.get(report.get("import_id"))
+                    if not results:
+                        continue
+                    added = _merge_results(report.setdefault("results", {}), results)
+                    if added:
+                        flags = engine.update(user, added, report["timestamp"], report["filename"], save=False)
+                        report.setdefault("flags", []).extend(flags)
+                        population.update(user, added, save=False)
+                        self.stats["values"] += len(added)
+                        self.stats["flags"] += len(flags)
+                        changed = True
+                return changed
+            # re-read under the history lock so reports appended meanwhile by other processes survive
+            report_store.update_user_reports(user, apply)
+        engine.save()
+        population.save()
+        self.late = {}
+
+
+def load_keywords():
+    with open(KEYWORDS_FILE, "r") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def import_file(path, known_users, default_user=None, patient_users=None, keywords=None, batch_size=BATCH_SIZE):
+    """
+    Imports a CSV export or FHIR bundle (chosen by extension). Returns (stats, unmapped codes/names).
+    """
+    parameter_map = ParameterMap(keywords or load_keywords())
+    filename = os.path.basename(path)
+    importer = HistoryImporter(set(known_users), batch_size)
+    if path.lower().endswith(".csv"):
+        source = "csv"
+        observations = iter_csv_observations(path, parameter_map, default_user, importer.stats)
+    elif path.lower().endswith(".json"):
+        source = "fhir"
+        observations = iter_fhir_observations(path, parameter_map, patient_users, default_user, importer.stats)
+    else:
+        raise ValueError(f"Unsupported export format: {filename} (expected .csv or .json)")
+
+    report_store.ensure_migrated()
+    for entry in group_reports(observations, source, filename):
+        importer.add(entry)
+    importer.finish()
+    return importer.stats, parameter_map.unmapped
+
+
+def _parse_mapping(pairs):
+    return dict(pair.split("=", 1) for pair in pairs)
+
+
+if __name__ == "__main__":
+    from user_directory import get_directory
+    parser = argparse.ArgumentParser(description="Import structured lab results (CSV or FHIR JSON bundle).")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--user", help="user for exports that carry no patient column")
+    parser.add_argument("--patient", nargs="*", default=[], metavar="PATIENT_ID=USER",
+                        help="map FHIR Patient ids to usernames")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+    for export_path in args.files:
+        totals, missing = import_file(export_path, get_directory().names(), args.user,
+                                      _parse_mapping(args.patient), batch_size=args.batch_size)
+        print(f"✅ {export_path}: {totals['reports']} reports, {totals['values']} values, "
+              f"{totals['flags']} flags ({totals['duplicates']} already imported, "
+              f"{totals['unknown_user']} for unknown users, {totals['bad_dates']} rows with unreadable dates)")
+        if missing:
+            top = sorted(missing.items(), key=lambda item: -item[1])[:10]
+            print("ℹ️ Unmapped codes/names: " + ", ".join(f"{label} ({count})" for label, count in top))
@@ -1,24 +1,329 @@
+import heapq
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
 import requests
+from file_utils import load_json, save_json, file_lock
 
 # ✅ Your Bot Token and Chat ID
 BOT_TOKEN = 'your bot token'
 CHAT_ID = 'your chatid'  # Siddhi's Telegram chat ID
 
-def send_telegram_message(message):
+# Point TELEGRAM_API_URL at fake_telegram.py to exercise the notifier offline
+API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
+
+OUTBOX_FILE = "telegram_outbox.json"
+JOURNAL_FILE = "telegram_outbox.journal"
+COALESCE_WINDOW = 5.0        # seconds a recipient's first pending message waits for company
+SENDING_LEASE = 300          # a claim left by a drain that died is taken over after this long
+MIN_INTERVAL_PER_CHAT = 1.0  # Telegram allows ~1 message/second to the same chat
+MIN_INTERVAL_GLOBAL = 1 / 30 # ...and ~30 messages/second overall
+MAX_RETRIES = 5              # 429 retries within one drain
+MAX_ATTEMPTS = 10            # drains before an undeliverable item is marked failed
+MAX_MESSAGE_LENGTH = 4096
+DELIVERED_RETENTION = 3 * 24 * 3600
+DIGEST_SEPARATOR = "\n\n———\n\n"
+
+SEND_STATS = {"requests": 0, "delivered": 0, "rate_limited": 0, "failed": 0}
+SEND_LATENCIES = deque(maxlen=100000)
+_session = requests.Session()
+
+
+def _post(message, chat_id):
     """
-    Sends a message to your Telegram using your bot.
+    Returns (delivered, retry_after). retry_after is set when Telegram rate-limits us (HTTP 429).
     """
-    url = f'https://api.telegram.org/bot{BOT_TOKEN}/sendMessage'
+    url = f'{API_URL}/bot{BOT_TOKEN}/sendMessage'
     payload = {
-        'chat_id': CHAT_ID,
+        'chat_id': chat_id,
         'text': message
     }
+    SEND_STATS["requests"] += 1
+    start = time.perf_counter()
+    try:
+        response = _session.post(url, data=payload, timeout=30)
+    finally:
+        SEND_LATENCIES.append(time.perf_counter() - start)
+    if response.status_code == 200:
+        SEND_STATS["delivered"] += 1
+        return True, None
+    if response.status_code == 429:
+        SEND_STATS["rate_limited"] += 1
+        try:
+            return False, float(response.json().get("parameters", {}).get("retry_after", 1))
+        except ValueError:
+            return False, 1.0
+    SEND_STATS["failed"] += 1
+    print(f"❌ Failed to send message. Response: {response.text}")
+    return False, None
 
+
+def send_telegram_message(message, chat_id=CHAT_ID):
+    """
+    Sends a message to your Telegram using your bot.
+    """
     try:
-        response = requests.post(url, data=payload)
-        if response.status_code == 200:
+        delivered, _ = _post(message, chat_id)
+        if delivered:
             print("✅ Telegram message sent successfully.")
-        else:
-            print(f"❌ Failed to send message. Response: {response.text}")
+        return delivered
     except Exception as e:
         print(f"⚠️ Error sending message: {e}")
+        return False
+
+
+def _load_outbox():
+    """
+    Loads the outbox and replays the delivery journal written since the last compaction.
+    """
+    items = load_json(OUTBOX_FILE, [])
+    if os.path.exists(JOURNAL_FILE):
+        by_id = {item["id"]: item for item in items}
+        with open(JOURNAL_FILE, "r") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue  # torn last line after a crash
+                for item_id in event["ids"]:
+                    item = by_id.get(item_id)
+                    if item:
+                        item["attempts"] += event.get("attempt", True)
+                        item["status"] = event["status"]
+                        item["sent_at"] = event["at"] if event["status"] != "pending" else None
+    return items
+
+
+def _save_outbox(items):
+    cutoff = time.time() - DELIVERED_RETENTION
+    save_json(OUTBOX_FILE, [i for i in items if i["status"] == "pending" or i["sent_at"] > cutoff], indent=None)
+    if os.path.exists(JOURNAL_FILE):
+        os.remove(JOURNAL_FILE)
+
+
+def _journal(items, status, attempt=True):
+    """
+    Appends one small line per send attempt (or claim) instead of rewriting the whole outbox.
+    """
+    if not items:
+        return
+    now = time.time()
+    for item in items:
+        item["attempts"] += attempt
+        item["status"] = status
+        item["sent_at"] = now if status != "pending" else None
+    with open(JOURNAL_FILE, "a") as f:
+        f.write(json.dumps({"ids": [i["id"] for i in items], "status": status, "at": now, "attempt": attempt}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def enqueue_messages(messages):
+    """
+    Durably queues (message, chat_id, dedupe_key) tuples with a single outbox write.
+    A dedupe_key already pending or recently delivered is ignored, so duplicated reminders
+    or a re-run after a crash never ping the same thing twice. Returns how many were queued.
+    """
+    with file_lock(OUTBOX_FILE):
+        return _enqueue(messages)
+
+
+def _enqueue(messages):
+    items = _load_outbox()
+    seen = {(i["chat_id"], i["dedupe_key"]) for i in items if i.get("dedupe_key")}
+    queued = 0
+    for message, chat_id, dedupe_key in messages:
+        if dedupe_key and (chat_id, dedupe_key) in seen:
+            continue
+        seen.add((chat_id, dedupe_key))
+        items.append({
+            "id": uuid.uuid4().hex,
+            "chat_id": chat_id,
+            "text": message,
+            "dedupe_key": dedupe_key,
+            "created": time.time(),
+            "status": "pending",
+            "attempts": 0,
+            "sent_at": None
+        })
+        queued += 1
+    if queued:
+        _save_outbox(items)
+    return queued
+
+
+def enqueue_message(message, chat_id=CHAT_ID, dedupe_key=None):
+    """
+    Returns True if the message was queued.
+    """
+    return enqueue_messages([(message, chat_id, dedupe_key)]) == 1
+
+
+def _digests(items):
+    """
+    Packs queued items into as few messages as fit under Telegram's length limit.
+    Returns a list of (text, items covered by that text).
+    """
+    if len(items) == 1:
+        return [(items[0]["text"][:MAX_MESSAGE_LENGTH], items)]
+    header = "🔔 Your notifications:\n\n"
+    digests, current, covered = [], header, []
+    for item in items:
+        piece = item["text"][:MAX_MESSAGE_LENGTH - len(header)]
+        candidate = current + (DIGEST_SEPARATOR if covered else "") + piece
+        if len(candidate) > MAX_MESSAGE_LENGTH:
+            digests.append((current, covered))
+            candidate, covered = header + piece, []
+        current = candidate
+        covered.append(item)
+    digests.append((current, covered))
+    return digests
+
+
+def drain_outbox(window=COALESCE_WINDOW, sleep=time.sleep):
+    """
+    Sends everything pending, one digest per recipient, pacing requests to stay under
+    Telegram's limits. Stops early (keeping items pending) if the network is down.
+    Items are claimed under the outbox lock and sent without it, so enqueues never wait on a
+    drain and concurrent drains (cron, dashboards, watcher) never send the same item twice.
+    Returns (messages sent, items delivered, retries).
+    """
+    with file_lock(OUTBOX_FILE):
+        now = time.time()
+        by_chat = {}
+        for item in _load_outbox():
+            if item["status"] == "pending" or (item["status"] == "sending" and item["sent_at"] < now - SENDING_LEASE):
+                by_chat.setdefault(item["chat_id"], []).append(item)
+        by_chat = {chat_id: pending for chat_id, pending in by_chat.items()
+                   if now - min(i["created"] for i in pending) >= window}
+        _journal([i for pending in by_chat.values() for i in pending], "sending", attempt=False)
+    try:
+        return _drain(by_chat, sleep)
+    finally:
+        with file_lock(OUTBOX_FILE):
+            _save_outbox(_load_outbox())
+
+
+def _settle(items, status, attempt=True):
+    with file_lock(OUTBOX_FILE):
+        _journal(items, status, attempt)
+
+
+def _drain(by_chat, sleep):
+    """
+    Sends the claimed digests in order of each chat's next allowed send time, so the
+    per-chat interval of one recipient is spent sending to the others.
+    """
+    queues = {chat_id: deque(_digests(sorted(pending, key=lambda i: i["created"])))
+              for chat_id, pending in by_chat.items()}
+    ready = [(0.0, n, chat_id) for n, chat_id in enumerate(queues)]
+    heapq.heapify(ready)
+    attempts = {}
+    sent, delivered, retries = 0, 0, 0
+    last_global = 0.0
+    try:
+        while ready:
+            not_before, n, chat_id = heapq.heappop(ready)
+            text, covered = queues[chat_id][0]
+            wait = max(not_before, last_global + MIN_INTERVAL_GLOBAL) - time.time()
+            if wait > 0:
+                sleep(wait)
+            try:
+                ok, retry_after = _post(text, chat_id)
+            except Exception as e:
+                print(f"⚠️ Error sending message, keeping it queued: {e}")
+                _settle(covered, "pending")
+                return sent, delivered, retries
+            last_global = time.time()
+            attempts[chat_id] = attempts.get(chat_id, 0) + 1
+            if not ok and retry_after is not None and attempts[chat_id] < MAX_RETRIES:
+                retries += 1
+                heapq.heappush(ready, (last_global + retry_after, n, chat_id))
+                continue
+
+            queues[chat_id].popleft()
+            attempts.pop(chat_id)
+            if ok:
+                _settle(covered, "delivered")
+                sent += 1
+                delivered += len(covered)
+                if queues[chat_id]:
+                    heapq.heappush(ready, (last_global + MIN_INTERVAL_PER_CHAT, n, chat_id))
+            else:
+                _settle([i for i in covered if i["attempts"] + 1 >= MAX_ATTEMPTS], "failed")
+                _settle([i for i in covered if i["status"] == "sending"], "pending")
+                # this recipient's remaining digests wait for the next drain
+                queues[chat_id].clear()
+        return sent, delivered, retries
+    finally:
+        unsent = [i for digests in queues.values() for _, covered in digests for i in covered if i["status"] == "sending"]
+        _settle(unsent, "pending", attempt=False)
+
+
+def notify(message, chat_id=CHAT_ID, dedupe_key=None):
+    """
+    Queues a message and immediately tries to deliver the outbox.
+    """
+    enqueue_message(message, chat_id, dedupe_key)
+    return drain_outbox(window=0)
+
+
+_pending_notifications = queue.Queue()
+_notifier_thread = None
+_notifier_start = threading.Lock()
+
+
+def _notifier_loop():
+    while True:
+        batch = [_pending_notifications.get()]
+        deadline = time.time() + COALESCE_WINDOW
+        queued = 0
+        try:
+            # each message is queued durably as it arrives, so closing the app loses nothing,
+            # but sending waits out the window so a burst reaches each recipient as one digest
+            while True:
+                while True:
+                    try:
+                        batch.append(_pending_notifications.get_nowait())
+                    except queue.Empty:
+                        break
+                if queued < len(batch):
+                    enqueue_messages(batch[queued:])
+                    queued = len(batch)
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(_pending_notifications.get(timeout=remaining))
+                except queue.Empty:
+                    pass
+            drain_outbox(window=0)
+        except Exception as e:
+            print(f"⚠️ Background notification failed, it stays queued for the next run: {e}")
+        finally:
+            for _ in batch:
+                _pending_notifications.task_done()
+
+
+def wait_for_notifications():
+    """
+    Blocks until everything handed to notify_in_background has been queued and a drain attempted.
+    """
+    _pending_notifications.join()
+
+
+def notify_in_background(message, chat_id=CHAT_ID, dedupe_key=None):
+    """
+    Hands the message to the process's single notifier thread and returns at once,
+    so the Tk thread never waits on pacing, retries or the network.
+    """
+    global _notifier_thread
+    with _notifier_start:
+        if _notifier_thread is None:
+            _notifier_thread = threading.Thread(target=_notifier_loop, name="telegram-notifier", daemon=True)
+            _notifier_thread.start()
+    _pending_notifications.put((message, chat_id, dedupe_key))
@@ -0,0 +1,172 @@
+import argparse
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from file_utils import load_json, save_json
+
+CACHE_DIR = "text_cache"
+KEYWORDS_FILE = "keywords.txt"
+
+
+def _base(digest):
+    return os.path.join(CACHE_DIR, digest[:2], digest)
+
+
+def has_text(digest):
+    return os.path.exists(f"{_base(digest)}.txt.z")
+
+
+def put_text(digest, normalized_text):
+    """
+    Stores the normalized text of a report, zlib-compressed and keyed by the PDF's SHA-256.
+    Returns the number of bytes written (0 if it was already cached).
+    """
+    path = f"{_base(digest)}.txt.z"
+    if os.path.exists(path):
+        return 0
+    data = zlib.compress(normalized_text.encode("utf-8"), 9)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return len(data)
+
+
+def get_text(digest):
+    path = f"{_base(digest)}.txt.z"
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return zlib.decompress(f.read()).decode("utf-8")
+
+
+def scanned_keywords(digest):
+    return set(load_json(f"{_base(digest)}.keywords.json", []))
+
+
+def mark_scanned(digest, keywords):
+    """
+    Remembers which keywords were already searched for in this text, found or not.
+    """
+    done = scanned_keywords(digest)
+    if not done.issuperset(keywords):
+        save_json(f"{_base(digest)}.keywords.json", sorted(done | set(keywords)), indent=None)
+
+
+def _scan(job):
+    from ingest import match_keywords
+    digest, keywords = job
+    text = get_text(digest)
+    return digest, keywords, match_keywords(text, keywords) if text is not None else None
+
+
+def _report_digest(report, refs_cache):
+    import blob_store
+    if report.get("sha256"):
+        return report["sha256"]
+    user = report.get("assigned_to")
+    if user not in refs_cache:
+        refs_cache[user] = blob_store.load_refs(user)
+    return refs_cache[user].get(report.get("filename"))
+
+
+def warm(owners):
+    """
+    Parses stored PDFs whose text is not cached yet. This is the only step that needs pdfplumber.
+    owners maps each digest to a user whose archive holds it once the loose blob is gone.
+    """
+    import blob_store
+    from ingest import extract_text, normalize_text
+    warmed = 0
+    for digest, user in owners.items():
+        if has_text(digest):
+            continue
+        path = blob_store.blob_path(digest)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                put_text(digest, normalize_text(extract_text(f.read(), path)))
+        else:
+            data = blob_store.read_archived(user, digest)
+            if data is None:
+                continue
+            put_text(digest, normalize_text(extract_text(data)))
+        warmed += 1
+    return warmed
+
+
+def backfill(keywords, workers=None, warm_missing=False):
+    """
+    Runs only the keywords a report has not been searched for over its cached text,
+    in parallel across reports, and merges new values into the history shards, matching
+    reports by (timestamp, filename) against a fresh read of each shard.
+    Returns (reports updated, values added, reports whose text is not available).
+    """
+    import report_store
+    refs_cache = {}
+    reports_by_digest = {}
+    pending = {}
+    unresolved = 0
+    for user in report_store.users():
+        for report in report_store.load_user_reports(user):
+            digest = _report_digest(report, refs_cache)
+            if not digest:
+                unresolved += 1
+                continue
+            todo = {k for k in keywords if k not in report.get("results", {})} - scanned_keywords(digest)
+            if todo:
+                reports_by_digest.setdefault(digest, []).append((user, (report["timestamp"], report["filename"])))
+                pending.setdefault(digest, set()).update(todo)
+
+    if warm_missing:
+        warm({d: reports_by_digest[d][0][0] for d in pending if not has_text(d)})
+
+    found_by_user, scanned_by_digest, uncached = {}, {}, 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = [(digest, sorted(todo)) for digest, todo in pending.items()]
+        for digest, scanned, found in pool.map(_scan, jobs, chunksize=16):
+            if found is None:
+                uncached += len(reports_by_digest[digest])
+                continue
+            for user, key in reports_by_digest[digest]:
+                found_by_user.setdefault(user, {})[key] = (digest, found)
+            scanned_by_digest[digest] = scanned
+
+    updated, added = 0, 0
+    for user, found_by_key in found_by_user.items():
+        def apply(reports):
+            nonlocal updated, added
+            changed = False
+            for report in reports:
+                match = found_by_key.get((report.get("timestamp"), report.get("filename")))
+                if not match:
+                    continue
+                digest, found = match
+                results = report.setdefault("results", {})
+                new_values = {k: v for k, v in found.items() if k not in results}
+                if new_values or not report.get("sha256"):
+                    results.update(new_values)
+                    report["sha256"] = digest
+                    updated += 1
+                    added += len(new_values)
+                    changed = True
+            return changed
+        report_store.update_user_reports(user, apply)
+    # marked only once the values are saved, so an interrupted run is simply repeated
+    for digest, scanned in scanned_by_digest.items():
+        mark_scanned(digest, scanned)
+    return updated, added, uncached + unresolved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply newly added keywords.txt entries to every stored report.")
+    parser.add_argument("--warm", action="store_true", help="parse stored PDFs whose text is not cached yet")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    with open(KEYWORDS_FILE, "r") as f:
+        keyword_list = [line.strip() for line in f if line.strip()]
+    reports, values, missing = backfill(keyword_list, args.workers, args.warm)
+    print(f"✅ Updated {reports} reports with {values} new values.")
+    if missing:
+        print(f"ℹ️ {missing} reports have no cached text; --warm parses stored PDFs once "
+              f"(reports uploaded before PDFs were stored cannot be backfilled).")
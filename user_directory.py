@@ -0,0 +1,78 @@
+import csv
+import os
+from bisect import bisect_left
+
+USERS_FILE = "users.csv"
+SEARCH_LIMIT = 20
+
+
+class UserDirectory:
+    """
+    In-memory index over users.csv. The file is only re-parsed when its size or mtime changes.
+    Prefix lookups use a sorted, case-folded key array, so they cost O(log n + k).
+    """
+
+    def __init__(self, path=USERS_FILE):
+        self.path = path
+        self.users = {}
+        self._signature = None
+        self._keys = []
+        self._names = []
+
+    def refresh(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"{self.path} not found")
+        stat = os.stat(self.path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return False
+
+        users = {}
+        with open(self.path, "r", newline='') as file:
+            reader = csv.DictReader(file)
+            for row in reader:
+                if not all(key in row for key in ["username", "password", "role"]):
+                    raise ValueError(f"Invalid {self.path} format")
+                users[row["username"]] = {
+                    "password": row["password"],
+                    "role": row["role"],
+                    "cohort": row.get("cohort") or None
+                }
+
+        index = sorted((name.casefold(), name) for name in users)
+        self.users = users
+        self._keys = [key for key, _ in index]
+        self._names = [name for _, name in index]
+        self._signature = signature
+        return True
+
+    def names(self):
+        self.refresh()
+        return list(self.users)
+
+    def get(self, username):
+        self.refresh()
+        return self.users.get(username)
+
+    def __contains__(self, username):
+        return self.get(username) is not None
+
+    def search(self, prefix, limit=SEARCH_LIMIT):
+        self.refresh()
+        prefix = prefix.strip().casefold()
+        matches = []
+        i = bisect_left(self._keys, prefix)
+        while i < len(self._keys) and len(matches) < limit and self._keys[i].startswith(prefix):
+            matches.append(self._names[i])
+            i += 1
+        return matches
+
+
+_directory = None
+
+
+def get_directory():
+    global _directory
+    if _directory is None:
+        _directory = UserDirectory()
+    return _directory
@@ -0,0 +1,272 @@
+import argparse
+import json
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from file_utils import load_json, save_json
+import report_store
+import service_client
+from anomaly import format_alert
+from ingest import parse_report, record_report
+from telegram_notifier import notify_in_background, wait_for_notifications
+from user_directory import get_directory
+
+WATCH_DIR = "incoming"                   # incoming/<user>/*.pdf, like user_reports/<user>/
+CHECKPOINT_FILE = "watch_checkpoint.json"
+KEYWORDS_FILE = "keywords.txt"
+POLL_INTERVAL = 2.0
+SETTLE_SECONDS = 5.0                     # size and mtime must hold still this long before a file is read
+QUEUE_SIZE = 16                          # files waiting for extraction; the scanner blocks when full
+
+
+def log(message):
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
+
+
+def _ignore_interrupt():
+    # Ctrl+C is handled by the main process, which lets queued files finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class FolderWatcher:
+    """
+    Polls the watch directories and ingests every PDF once it has stopped changing.
+    A bounded queue sits between the scanner and the extraction workers, so a flood of files
+    stalls the scanner instead of piling up in memory; the checkpoint records each file's
+    size and mtime so a restart skips what was already ingested (or already failed).
+    Outcomes are appended to a journal next to the checkpoint and folded into it on start,
+    dropping files that are no longer there.
+    """
+
+    def __init__(self, watch_dirs=(WATCH_DIR,), folder_users=None, workers=None,
+                 settle=SETTLE_SECONDS, poll=POLL_INTERVAL, queue_size=QUEUE_SIZE,
+                 checkpoint_path=CHECKPOINT_FILE):
+        self.watch_dirs = list(watch_dirs)
+        self.folder_users = folder_users or {}
+        self.workers = workers or os.cpu_count() or 1
+        self.settle = settle
+        self.poll = poll
+        self.checkpoint_path = checkpoint_path
+        self.journal_path = os.path.splitext(checkpoint_path)[0] + ".jsonl"
+        self.checkpoint = self._load_checkpoint()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.candidates = {}   # path -> (signature, monotonic time it was first seen with it)
+        self.in_flight = set()
+        self.warned = set()
+        with open(KEYWORDS_FILE, "r") as f:
+            self.keywords = [line.strip() for line in f if line.strip()]
+
+    def _load_checkpoint(self):
+        checkpoint = load_json(self.checkpoint_path, {})
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    try:
+                        path, entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line after a crash
+                    checkpoint[path] = entry
+        checkpoint = {path: entry for path, entry in checkpoint.items() if os.path.exists(path)}
+        save_json(self.checkpoint_path, checkpoint, indent=None)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        return checkpoint
+
+    def _record(self, path, entry):
+        # callers hold self.lock
+        self.checkpoint[path] = entry
+        with open(self.journal_path, "a") as f:
+            f.write(json.dumps([path, entry]) + "\n")
+
+    def _scandir(self, path):
+        """
+        Lists a directory, or returns None (logging once) if it vanished or cannot be read,
+        so one bad folder never stops the scanner.
+        """
+        try:
+            with os.scandir(path) as entries:
+                entries = list(entries)
+        except OSError as e:
+            if path not in self.warned:
+                self.warned.add(path)
+                log(f"⚠️ Cannot read {path}, skipping it until it can: {e}")
+            return None
+        self.warned.discard(path)
+        return entries
+
+    def _user_for(self, folder):
+        user = self.folder_users.get(folder, folder)
+        if user in get_directory():
+            return user
+        if folder not in self.warned:
+            self.warned.add(folder)
+            log(f"⚠️ Ignoring folder '{folder}': no user of that name in users.csv")
+        return None
+
+    def _is_done(self, path, signature):
+        entry = self.checkpoint.get(path)
+        return entry is not None and entry["signature"] == signature
+
+    def scan(self):
+        """
+        One pass over the watch directories. Returns the (path, user, signature) items that are ready.
+        """
+        now = time.monotonic()
+        ready, seen, listed = [], set(), set()
+        for watch_dir in self.watch_dirs:
+            if not os.path.isdir(watch_dir):
+                continue
+            for folder in self._scandir(watch_dir) or []:
+                if not folder.is_dir():
+                    continue
+                items = self._scandir(folder.path)
+                if items is None:
+                    continue
+                listed.add(os.path.abspath(folder.path))
+                for item in items:
+                    if not item.is_file() or not item.name.lower().endswith(".pdf"):
+                        continue
+                    path = os.path.abspath(item.path)
+                    seen.add(path)
+                    try:
+                        signature = _signature(path)
+                    except FileNotFoundError:
+                        continue
+                    if path in self.in_flight or self._is_done(path, signature):
+                        continue
+                    previous = self.candidates.get(path)
+                    if previous is None or previous[0] != signature:
+                        self.candidates[path] = (signature, now)
+                        continue
+                    if now - previous[1] < self.settle:
+                        continue
+                    user = self._user_for(folder.name)
+                    if user:
+                        ready.append((path, user, signature))
+        for path in set(self.candidates) - seen:
+            del self.candidates[path]
+        with self.lock:
+            # entries for files removed from a folder that was read in full are no longer needed
+            for path in [p for p in self.checkpoint if p not in seen and os.path.dirname(p) in listed]:
+                del self.checkpoint[path]
+        return ready
+
+    def _scanner(self):
+        while not self.stop_event.is_set():
+            try:
+                ready = self.scan()
+            except Exception as e:
+                log(f"⚠️ Scan failed, retrying: {e}")
+                ready = []
+            for path, user, signature in ready:
+                del self.candidates[path]
+                with self.lock:
+                    self.in_flight.add(path)
+                # blocks while the workers are behind: this is the back-pressure
+                while not self.stop_event.is_set():
+                    try:
+                        self.queue.put((path, user, signature), timeout=self.poll)
+                        break
+                    except queue.Full:
+                        continue
+                if self.stop_event.is_set():
+                    return
+            self.stop_event.wait(self.poll)
+
+    def _ingest(self, pool, path, user):
+        filename = os.path.basename(path)
+        if service_client.enabled():
+            return service_client.ingest(path, user, filename)
+        digest, text, results = pool.submit(parse_report, path, self.keywords, workers=1).result()
+        with self.lock:
+            entry = record_report(digest, text, results, user, filename)
+            report_store.append_report(entry)
+        return entry
+
+    def _worker(self, pool):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            path, user, signature = item
+            status = "ingested"
+            try:
+                entry = self._ingest(pool, path, user)
+                log(f"✅ {path} -> {user}: {len(entry['results'])} parameters extracted")
+                if entry["flags"]:
+                    # one notifier thread per process, so workers never drain the outbox concurrently
+                    notify_in_background(format_alert(user, entry["flags"]))
+            except FileNotFoundError:
+                status = None
+                log(f"ℹ️ {path} disappeared before it could be ingested")
+            except Exception as e:
+                status = "failed"
+                log(f"❌ Failed to ingest {path}: {e}")
+            with self.lock:
+                self.in_flight.discard(path)
+                if status:
+                    self._record(path, {
+                        "signature": signature,
+                        "user": user,
+                        "status": status,
+                        "at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    })
+            self.queue.task_done()
+
+    def run(self):
+        log(f"👀 Watching {', '.join(self.watch_dirs)} with {self.workers} worker(s)")
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_ignore_interrupt) as pool:
+            workers = [threading.Thread(target=self._worker, args=(pool,), daemon=True)
+                       for _ in range(self.workers)]
+            for thread in workers:
+                thread.start()
+            scanner = threading.Thread(target=self._scanner, daemon=True)
+            scanner.start()
+            try:
+                while scanner.is_alive():
+                    scanner.join(0.5)
+            except KeyboardInterrupt:
+                log("🛑 Stopping; finishing files already queued")
+            self.stop_event.set()
+            scanner.join()
+            for _ in workers:
+                self.queue.put(None)
+            for thread in workers:
+                thread.join()
+        wait_for_notifications()
+
+
+def _parse_mapping(pairs):
+    mapping = {}
+    for pair in pairs:
+        folder, _, user = pair.partition("=")
+        if not user:
+            raise argparse.ArgumentTypeError(f"expected folder=user, got {pair}")
+        mapping[folder] = user
+    return mapping
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest PDFs dropped into <watch dir>/<user>/ automatically.")
+    parser.add_argument("watch_dirs", nargs="*", default=[WATCH_DIR])
+    parser.add_argument("--map", nargs="*", default=[], metavar="FOLDER=USER",
+                        help="subfolders whose name is not the username")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS)
+    parser.add_argument("--poll", type=float, default=POLL_INTERVAL)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    args = parser.parse_args()
+    report_store.ensure_migrated()
+    FolderWatcher(args.watch_dirs, _parse_mapping(args.map), args.workers,
+                  args.settle, args.poll, args.queue_size).run()